@@ -0,0 +1,251 @@
+#! /usr/bin/python
+"""
+Benchmark of lineProfilesFromSlice pipeline on synthetic ParaView slices. Generates csv files of several sizes (kept in
+work directory and reused by subsequent runs), measures ingestion, grouping, segmentation and rendering stages and
+writes machine readable results, so that versions can be compared and scaling checked.
+"""
+
+try:
+    import numpy
+except:
+    print('The "numpy" required. Install this python package before usage')
+    exit()
+
+
+def sliceData(lines, pointsPerLine, gaps=0, extraColumns=0, seed=0):
+    """
+    Generates columns of synthetic ParaView slice: points of sampling lines spread along direction 0 and sampled along
+    direction 1, stored in random order like ParaView does. Spacing coordinates are perturbed below rounding precision
+    :param lines: number of sampling lines
+    :param pointsPerLine: number of points of each line (before removing gaps)
+    :param gaps: number of gaps cut in each line, points inside gaps are removed
+    :param extraColumns: number of additional scalar columns which are not plotted
+    :return: dictionary of columns, the same as loadData returns
+    """
+    import numpy as np
+
+    rng = np.random.RandomState(seed)
+
+    x = np.repeat(np.arange(lines) * 0.1, pointsPerLine) + rng.uniform(-1e-6, 1e-6, lines * pointsPerLine)
+    y = np.tile(np.linspace(0., 1., pointsPerLine), lines)
+    z = np.zeros_like(x)
+
+    keep = np.ones(len(x), dtype=bool)
+    for i in range(gaps):
+        # gaps at different position of each line, each takes 5% of the line
+        start = rng.uniform(0., 0.95, lines)
+        inGap = (y >= np.repeat(start, pointsPerLine)) & (y < np.repeat(start + 0.05, pointsPerLine))
+        keep &= ~inGap
+
+    order = rng.permutation(np.flatnonzero(keep))
+    x, y, z = x[order], y[order], z[order]
+
+    data = {'U:0': np.sin(4 * y + x), 'U:1': np.cos(3 * y) * 0.1, 'U:2': z, 'p': y * y - x,
+            'Points:0': x, 'Points:1': y, 'Points:2': z}
+    for i in range(extraColumns):
+        data['extra{}'.format(i)] = rng.uniform(size=len(x))
+    return data
+
+
+def writeSlice(path, data, chunkSize=100000):
+    """
+    Writes columns in ParaView csv format (quoted header, full precision values)
+    """
+    import numpy as np
+
+    names = sorted(data)
+    with open(path, 'w') as f:
+        f.write(','.join('"{}"'.format(n) for n in names) + '\n')
+        values = np.column_stack([data[n] for n in names])
+        for start in range(0, len(values), chunkSize):
+            np.savetxt(f, values[start:start + chunkSize], fmt='%.17g', delimiter=',')
+
+
+def slicePath(workdir, points, lines, gaps, extraColumns):
+    """
+    Path of generated slice with given parameters, the file is generated if it does not exist yet
+    """
+    import os
+
+    path = os.path.join(workdir, 'slice_{}_{}_{}_{}.csv'.format(points, lines, gaps, extraColumns))
+    if not os.path.exists(path):
+        if not os.path.exists(workdir):
+            os.makedirs(workdir)
+        data = sliceData(lines, max(points // lines, 2), gaps, extraColumns)
+        writeSlice(path + '.tmp', data)
+        os.rename(path + '.tmp', path)
+    return path
+
+
+def runPipeline(lp, timer, path, render=True):
+    """
+    Runs profiles pipeline of lineProfilesFromSlice on the file with stages measured by the timer
+    :param lp: lineProfilesFromSlice module
+    """
+    import io
+
+    lp.stageTimer = timer
+    try:
+        with timer.stage('ingestion'):
+            data = lp.loadData(path, columns=['U:0', 'Points:0', 'Points:1'])
+        with timer.stage('index'):
+            index = lp.profileIndex(data, 0, 1, 3)
+        if render:
+            import matplotlib.pyplot as plt
+
+            with timer.stage('rendering'):
+                plt.figure()
+                axesConfig = {'ymin': None, 'ymax': None, 'scale': 1., 'xmin': None, 'xmax': None}
+                pltSetup = {'type': '-b', 'marker': ' ', 'linewidth': 1., 'grid': False, 'labels': False,
+                            'refline': True}
+                lp.plot(data, 0, 1, 'U:0', 3, axesConfig, pltSetup, True, index=index)
+                with timer.stage('saving'):
+                    plt.savefig(io.BytesIO(), format='png')
+                plt.close()
+    finally:
+        lp.stageTimer = None
+    return len(data['Points:0'])
+
+
+def benchmark(sizes, lines=100, gaps=1, extraColumns=3, repeat=3, workdir='benchmark', render=True, memory=False):
+    """
+    Benchmarks the pipeline for each number of points
+    :param repeat: each file is processed that many times, best and median time is reported
+    :param memory: measure peak memory of stages (slows down the run)
+    :return: list of dictionaries with points, stage (nested stages joined with "/"), calls, best, median, peak and
+             points per second
+    """
+    import os
+    import sys
+    import numpy as np
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    sys.path.insert(0, os.path.join(here, os.pardir))
+    import lineProfilesFromSlice as lp
+    from tools.timing import StageTimer
+
+    if render:
+        # import outside of measured stages
+        import matplotlib.pyplot
+
+    results = []
+    for size in sizes:
+        path = slicePath(workdir, size, lines, gaps, extraColumns)
+        runs = dict()
+        for i in range(repeat):
+            timer = StageTimer(memory)
+            with timer.stage('total'):
+                points = runPipeline(lp, timer, path, render)
+            timer.stop()
+
+            for stats in timer.results():
+                runs.setdefault('/'.join(stats['path']), []).append(stats)
+
+        for name, stats in runs.items():
+            times = [s['time'] for s in stats]
+            results.append({'points': points, 'size': size, 'lines': lines, 'gaps': gaps,
+                            'extraColumns': extraColumns, 'stage': name, 'calls': stats[0]['calls'],
+                            'best': min(times), 'median': float(np.median(times)),
+                            'peak': max(s['peak'] for s in stats) if memory else None,
+                            'pointsPerSecond': points / min(times) if min(times) > 0 else None})
+        print("{} points: total {:.3f} s".format(points, min(s['time'] for s in runs['total'])))
+    return results
+
+
+def environment():
+    """
+    Versions of interpreter and libraries results were measured with
+    """
+    import platform
+    import numpy as np
+    import matplotlib
+
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(), 'processor': platform.processor()}
+
+
+def writeResults(path, results, label=None):
+    """
+    Writes results as json (with environment description) or csv, depending on file extension
+    """
+    import csv
+    import json
+    import time
+
+    if path.endswith('.csv'):
+        keys = ['size', 'points', 'lines', 'gaps', 'extraColumns', 'stage', 'calls', 'best', 'median', 'peak',
+                'pointsPerSecond']
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, keys)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'label': label, 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'environment': environment(),
+                       'results': results}, f, indent=1, sort_keys=True)
+
+
+def printResults(results):
+    """
+    Prints table of stages times for each size, nested stages are indented
+    """
+    sizes = sorted(set(r['points'] for r in results))
+    stages = []
+    for r in results:
+        if r['stage'] not in stages:
+            stages.append(r['stage'])
+    # nested stages follow their parent stage, stages of different sizes may be first seen in different runs
+    first = dict((st, i) for i, st in enumerate(stages))
+    stages.sort(key=lambda st: [first.get('/'.join(st.split('/')[:i + 1]), len(stages))
+                                for i in range(st.count('/') + 1)])
+    best = dict(((r['stage'], r['points']), r['best']) for r in results)
+
+    width = max(len(s) for s in stages)
+    print(' ' * (width + 1) + ' '.join('{:>12}'.format(s) for s in sizes))
+    for s in stages:
+        name = '  ' * s.count('/') + s.split('/')[-1]
+        print('{:<{}} '.format(name, width) + ' '.join('{:>12.4f}'.format(best[(s, n)]) if (s, n) in best
+                                                      else '{:>12}'.format('-') for n in sizes))
+
+
+def sizeArg(value):
+    """
+    Parses comma separated list of sizes, scientific notation allowed (1e6)
+    """
+    return [int(float(v)) for v in value.split(',')]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+    except:
+        print('The "matplotlib" required to render profiles. Install this python package before usage')
+        exit()
+
+    parser = argparse.ArgumentParser(description='Benchmarks lineProfilesFromSlice on synthetic ParaView slices of '
+                                                 'several sizes and writes time of each pipeline stage')
+    parser.add_argument("-o", "--output", type=str, default='benchmark.json',
+                        help='Results file, *.json (with environment description) or *.csv')
+    parser.add_argument("--sizes", type=sizeArg, default=[10**4, 10**5, 10**6, 10**7],
+                        help='Comma separated numbers of points, default 1e4,1e5,1e6,1e7')
+    parser.add_argument("--lines", type=int, default=100, help='Number of sampling lines')
+    parser.add_argument("--gaps", type=int, default=1, help='Number of gaps in each sampling line')
+    parser.add_argument("--extra", type=int, default=3, help='Number of additional columns which are not plotted')
+    parser.add_argument("-n", "--repeat", type=int, default=3, help='Number of runs for each size')
+    parser.add_argument("--workdir", type=str, default='benchmark',
+                        help='Directory for generated slices, existing files are reused')
+    parser.add_argument("--no-render", action="store_true", help='Skip rendering stage')
+    parser.add_argument("--memory", action="store_true",
+                        help='Measure peak memory of stages with tracemalloc, slows down the run')
+    parser.add_argument("--label", type=str, help='Name of measured version stored in json results')
+
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.lines, args.gaps, args.extra, args.repeat, args.workdir, not args.no_render,
+                        args.memory)
+    printResults(results)
+    writeResults(args.output, results, args.label)
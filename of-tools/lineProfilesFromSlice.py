@@ -1,204 +1,2139 @@
 #! /usr/bin/python
 
 try:
-    import numpy, matplotlib
+    import numpy
 except:
-    print('The "numpy", "matplotlib" required. Install these python packages before usage')
+    print('The "numpy" required. Install this python package before usage')
     exit()
 
+# StageTimer of tools/timing.py, set by --profile option
+stageTimer = None
 
-def loadData(path):
+
+def stage(name):
+    """
+    Context measuring named pipeline stage with stageTimer, does nothing if profiling is disabled
+    """
+    from contextlib import contextmanager
+
+    @contextmanager
+    def noop():
+        yield None
+
+    return stageTimer.stage(name) if stageTimer is not None else noop()
+
+
+def toolsPath():
+    """
+    Makes tools package of the repository (parent directory of of-tools) importable
+    """
+    import os
+    import sys
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+
+def isCompressed(path):
+    """
+    Checks if path is gzip or xz compressed file (extensions of tools/file.py COMPRESSED_EXTENSIONS). Without tools
+    package (script copied out of the repository) all files are taken as plain text
+    """
+    toolsPath()
+    try:
+        from tools.file import _compressed
+    except ImportError:
+        return False
+
+    return _compressed(path)
+
+
+def openText(path):
+    """
+    Opens text file for reading, gzip and xz compressed files (*.gz, *.xz) are decompressed while read with copen
+    of tools/file.py
+    """
+    import io
+
+    if not isCompressed(path):
+        return open(path, 'r')
+
+    from tools.file import copen
+
+    return io.TextIOWrapper(copen(path, seekable=False))
+
+
+def readHeader(f):
+    """
+    Reads column names from ParaView csv header line
+    :param f: file object positioned at the beginning of the file
+    """
+    return f.readline().replace('"', '').replace('\n', '').replace('\r', '').split(',')
+
+
+def columnIndices(names, columns, path):
+    """
+    Maps requested column names to their positions in csv header
+    :param names: column names read from header
+    :param columns: requested column names, if None all columns are selected
+    :param path: csv file path, used only in error message
+    """
+    if columns is None:
+        return list(range(len(names)))
+
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise KeyError("Columns {} not found in {}, available columns: {}".format(missing, path, ', '.join(names)))
+
+    return [names.index(c) for c in columns]
+
+
+def cacheFiles(path):
+    """
+    Returns paths of binary sidecar files for given csv file: columns matrix (*.npy) and its description (*.json)
+    """
+    return path + '.cache.npy', path + '.cache.json'
+
+
+def cacheKey(path):
+    """
+    Key identifying the state of csv file, cache is valid only as long as file size and modification time match
+    """
+    import os
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def loadCachedData(path, columns=None, dtype=float):
+    """
+    Loads columns from binary sidecar of csv file. Columns are memory mapped, so only accessed data is read from disk
+    :param columns: requested column names, if None all columns stored in cache are returned
+    :param dtype: requested floating point type, cache stored with lower precision is not used. If None columns are
+                  returned in stored type
+    :return: dictionary of columns or None if cache does not exist, is outdated or does not contain requested columns
+    """
+    import json
+    import os
+    import numpy as np
+
+    dataFile, descFile = cacheFiles(path)
+    if not os.path.exists(dataFile) or not os.path.exists(descFile):
+        return None
+
+    try:
+        with open(descFile, 'r') as f:
+            desc = json.load(f)
+        if desc['key'] != cacheKey(path):
+            return None
+        pureData = np.load(dataFile, mmap_mode='r')
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+    names = desc['names']
+    if pureData.ndim != 2 or pureData.shape[0] != len(names):
+        return None
+
+    if columns is None:
+        columns = names
+    elif any(c not in names for c in columns):
+        return None
+
+    dtype = np.dtype(dtype) if dtype is not None else pureData.dtype
+    if dtype.itemsize > pureData.dtype.itemsize:
+        return None
+
+    res = dict()
+    for n in columns:
+        res[n] = pureData[names.index(n)].astype(dtype, copy=False)
+    return res
+
+
+def storeCachedData(path, names, pureData):
+    """
+    Writes parsed columns to binary sidecar of csv file. Columns of valid cache which were not parsed again (other
+    fields loaded before) are kept when stored with the same type. Files are written under temporary names and moved
+    in place afterwards, so concurrent runs never see partially written cache
+    """
+    import json
+    import os
+    import numpy as np
+
+    cached = loadCachedData(path, dtype=None)
+    if cached:
+        kept = [n for n in cached if n not in names]
+        if kept and all(cached[n].dtype == pureData.dtype and len(cached[n]) == pureData.shape[1] for n in kept):
+            pureData = np.vstack([cached[n] for n in kept] + [pureData])
+            names = kept + list(names)
+        cached = None
+
+    dataFile, descFile = cacheFiles(path)
+    try:
+        with open(dataFile + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(pureData))
+        with open(descFile + '.tmp', 'w') as f:
+            json.dump({'key': cacheKey(path), 'names': names}, f)
+        # data first, description last: description with valid key is the marker of complete cache
+        os.rename(dataFile + '.tmp', dataFile)
+        os.rename(descFile + '.tmp', descFile)
+    except (IOError, OSError):
+        print("Can't write cache for {}".format(path))
+
+
+def readChunks(f, names, usecols, dtype, chunkSize):
+    """
+    Generator parsing csv rows in chunks of fixed number of rows
+    :param f: file object positioned after the header
+    :return: dictionaries mapping column name to array of values of the chunk
+    """
+    from itertools import islice
+    import numpy as np
+
+    while True:
+        lines = list(islice(f, chunkSize))
+        if not lines:
+            break
+        pureData = np.loadtxt(lines, delimiter=',', usecols=usecols, dtype=dtype, ndmin=2).T
+        yield dict((names[c], pureData[i]) for i, c in enumerate(usecols))
+
+
+def sliceChunks(data, chunkSize):
+    """
+    Generator splitting loaded columns into chunks of fixed number of rows (views, no data is copied)
+    """
+    length = len(next(iter(data.values()))) if data else 0
+    for start in range(0, length, chunkSize or max(length, 1)):
+        yield dict((n, v[start:start + chunkSize] if chunkSize else v) for n, v in data.items())
+
+
+def joinChunks(chunks, dtype):
+    """
+    Concatenates filtered chunks into dictionary of columns
+    """
+    import numpy as np
+
+    parts = dict()
+    for chunk in chunks:
+        for n, v in chunk.items():
+            parts.setdefault(n, []).append(v)
+    return dict((n, np.concatenate(v) if v else np.zeros(0, dtype=dtype)) for n, v in parts.items())
+
+
+def loadData(path, cache=False, columns=None, dtype=float, chunkSize=None, chunkFilter=None):
+    """
+    Loads ParaView csv file, optionally compressed with gzip or xz (*.csv.gz, *.csv.xz)
+    :param cache: if True, parsed columns are stored in binary sidecar next to the csv file and subsequent calls
+                  load them memory mapped instead of parsing the text again
+    :param columns: names of columns to read, other columns are skipped while parsing. If None all columns are read
+    :param dtype: floating point type of loaded columns, e.g. numpy.float32 to halve memory usage
+    :param chunkSize: if set, file is streamed in chunks of that many rows instead of being parsed at once, so peak
+                      memory is bounded by chunk size plus data kept by chunkFilter. Cache is not written in this mode
+    :param chunkFilter: function taking dictionary of chunk columns and returning dictionary of columns which shall
+                        be kept, e.g. ProfileWindow
+    :return: dictionary mapping column name to array of values
+    """
+    import numpy as np
+
+    if cache:
+        res = loadCachedData(path, columns, dtype)
+        if res is not None:
+            if chunkFilter is not None:
+                res = joinChunks(map(chunkFilter, sliceChunks(res, chunkSize)), dtype)
+            return res
+
+    with openText(path) as f:
+        names = readHeader(f)
+        usecols = columnIndices(names, columns, path)
+
+        if chunkSize:
+            chunks = readChunks(f, names, usecols, dtype, chunkSize)
+            if chunkFilter is not None:
+                chunks = map(chunkFilter, chunks)
+            res = joinChunks(chunks, dtype)
+            for c in usecols:
+                res.setdefault(names[c], np.zeros(0, dtype=dtype))
+            return res
+
+        pureData = np.loadtxt(f, delimiter=',', usecols=usecols, dtype=dtype, ndmin=2).T
+    names = [names[i] for i in usecols]
+
+    if cache:
+        storeCachedData(path, names, pureData)
+
+    res = dict()
+    for i, n in enumerate(names):
+        res[n] = pureData[i]
+
+    if chunkFilter is not None:
+        res = chunkFilter(res)
+    return res
+
+
+SET_EXTENSIONS = ('.xy', '.raw', '.dat', '.csv')
+SET_COMPONENTS = (1, 3, 6, 9)
+SET_AXES = {'xyz': ["Points:0", "Points:1", "Points:2"], 'x': ["Points:0"], 'y': ["Points:1"], 'z': ["Points:2"],
+            'distance': ["distance"]}
+
+
+def setColumnName(name):
+    """
+    Translates OpenFOAM sample set column name to ParaView convention: x, y, z -> Points:0, Points:1, Points:2 and
+    vector/tensor components U_0 -> U:0
+    """
+    import re
+
+    if name in ('x', 'y', 'z'):
+        return "Points:{}".format('xyz'.index(name))
+    match = re.match(r'^(.+)_(\d)$', name)
+    if match:
+        return "{}:{}".format(*match.groups())
+    return name
+
+
+def setFileColumns(path, ncols, axis='xyz'):
+    """
+    Deduces column names of OpenFOAM sample set file without header from its name <setName>_<field1>_<field2>...
+    OpenFOAM writes fields of one type (scalars, vectors, ...) to one file, so the column count has to be equal to
+    number of coordinates plus number of fields times number of components of that type
+    :param axis: "axis" entry of the sets dictionary, defines coordinate columns
+    :return: tuple (setName, column names)
+    """
+    import os
+
+    coords = SET_AXES[axis]
+    parts = os.path.splitext(os.path.basename(path))[0].split('_')
+    for k in range(1, len(parts)):
+        fields = parts[k:]
+        for comp in SET_COMPONENTS:
+            if len(coords) + len(fields) * comp == ncols:
+                if comp == 1:
+                    return '_'.join(parts[:k]), coords + fields
+                return '_'.join(parts[:k]), coords + ["{}:{}".format(f, c) for f in fields for c in range(comp)]
+
+    raise Exception("Can't deduce columns of {} with {} columns for axis {}".format(path, ncols, axis))
+
+
+def readSetFile(path, axis='xyz', dtype=float):
+    """
+    Parses single OpenFOAM sample set file written in raw, xy or csv format. The file is memory mapped and its
+    numerical part is converted in one call, without splitting it into lines
+    :return: tuple (setName, dictionary mapping column name to array of values)
+    """
+    import mmap
+    import os
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return setFileColumns(path, len(SET_AXES[axis]) + 1, axis)[0], dict()
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = None
+            offset = 0
+            first = b''
+            while offset < size:
+                end = mm.find(b'\n', offset)
+                end = size if end < 0 else end
+                first = mm[offset:end].strip()
+                if first and (first.startswith(b'#') or not (first[:1].isdigit() or first[:1] in b'-+.')):
+                    header = first.lstrip(b'#')
+                elif first:
+                    break
+                offset = end + 1
+            body = mm[offset:]
+        finally:
+            mm.close()
+
+    if b',' in first:
+        body = body.replace(b',', b' ')
+        first = first.replace(b',', b' ')
+        header = header.replace(b',', b' ') if header else header
+    ncols = len(first.split())
+    pureData = np.fromstring(body, dtype=dtype, sep=' ').reshape(-1, ncols).T if ncols else np.zeros((0, 0))
+
+    names = header.decode('ascii', 'replace').split() if header else []
+    if len(names) == ncols:
+        names = [setColumnName(n) for n in names]
+        # file name is <setName>_<field1>_<field2>..., strip field names to get the set name
+        setName = os.path.splitext(os.path.basename(path))[0]
+        fields = []
+        for n in names:
+            base = n.split(':')[0]
+            if base not in fields and base != 'distance' and not n.startswith('Points:'):
+                fields.append(base)
+        suffix = '_' + '_'.join(fields)
+        if fields and setName.endswith(suffix) and len(setName) > len(suffix):
+            setName = setName[:-len(suffix)]
+    else:
+        setName, names = setFileColumns(path, ncols, axis)
+
+    return setName, dict((n, pureData[i]) for i, n in enumerate(names))
+
+
+def loadSets(path, columns=None, dtype=float, axis='xyz'):
+    """
+    Loads OpenFOAM sample sets (postProcessing/<sets>/<time>/*.xy|csv) into the same dictionary of columns as loadData
+    produces. Files of the same set (e.g. scalars and vectors) are joined, points of all sets are concatenated, so
+    each set forms one sampling line
+    :param path: time directory of sample sets or single set file
+    :param columns: names of columns to return, if None columns present in all sets are returned
+    :param axis: "axis" entry of the sets dictionary, used for files written without header
+    """
+    import os
+    import numpy as np
+
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if os.path.splitext(f)[1] in SET_EXTENSIONS)
+    else:
+        files = [path]
+
+    sets = dict()
+    for f in files:
+        setName, setData = readSetFile(f, axis, dtype)
+        sets.setdefault(setName, dict()).update(setData)
+
+    names = [n for n in sorted(set(n for d in sets.values() for n in d)) if all(n in d for d in sets.values())]
+    if columns is None:
+        columns = names
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise KeyError("Columns {} not found in all sets of {}, available columns: {}".format(missing, path,
+                                                                                               ', '.join(names)))
+
+    return dict((c, np.concatenate([sets[s][c] for s in sorted(sets)]).astype(dtype, copy=False)) for c in columns)
+
+
+def setTimes(setsDir):
+    """
+    Returns time directories of sample sets sorted by time, as list of (time, path)
+    """
+    import os
+
+    times = []
+    for d in os.listdir(setsDir):
+        try:
+            times.append((float(d), os.path.join(setsDir, d)))
+        except ValueError:
+            continue
+    return sorted(times)
+
+
+def loadSetsTimes(setsDir, columns=None, dtype=float, axis='xyz', jobs=None):
+    """
+    Loads sample sets of all time directories of postProcessing/<sets> directory, time directories are parsed in
+    parallel on a pool of worker processes
+    :param jobs: number of worker processes, by default number of CPUs
+    :return: list of tuples (time, data) sorted by time, see loadSets
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    times = setTimes(setsDir)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        tasks = [executor.submit(loadSets, p, columns, dtype, axis) for _, p in times]
+        return [(t, task.result()) for (t, _), task in zip(times, tasks)]
+
+
+VTK_EXTENSIONS = ('.vtp', '.vtu')
+VTK_TYPES = {'Int8': 'i1', 'UInt8': 'u1', 'Int16': 'i2', 'UInt16': 'u2', 'Int32': 'i4', 'UInt32': 'u4',
+             'Int64': 'i8', 'UInt64': 'u8', 'Float32': 'f4', 'Float64': 'f8'}
+
+
+def vtkBlock(buf, pos, headerType, compressor, encoded):
+    """
+    Decodes single binary data array block of VTK XML file
+    :param buf: bytes like object holding the block (appended data section or base64 text of inline array)
+    :param pos: position of the block in buf
+    :param headerType: numpy type of block header
+    :param compressor: None, "zlib" or "lzma"
+    :param encoded: True if block is base64 encoded
+    :return: bytes like object with raw array data
+    """
+    import base64
+    import numpy as np
+
+    size = headerType.itemsize
+
+    def decode(start, nbytes):
+        # base64 encodes each 3 bytes in 4 characters
+        if encoded:
+            chars = (nbytes + 2) // 3 * 4
+            return base64.b64decode(bytes(buf[start:start + chars])), start + chars
+        return buf[start:start + nbytes], start + nbytes
+
+    if compressor is None:
+        if encoded:
+            # header and data are encoded together
+            nbytes = int(np.frombuffer(base64.b64decode(bytes(buf[pos:pos + (size + 2) // 3 * 4])), headerType, 1)[0])
+            return decode(pos, size + nbytes)[0][size:]
+        nbytes = int(np.frombuffer(buf, headerType, 1, pos)[0])
+        return buf[pos + size:pos + size + nbytes]
+
+    if compressor == 'zlib':
+        import zlib
+        decompress = zlib.decompress
+    else:
+        import lzma
+        decompress = lzma.decompress
+
+    # header: number of blocks, block size, last block size, compressed sizes of blocks
+    nblocks = int(np.frombuffer(decode(pos, size)[0], headerType, 1)[0])
+    header, pos = decode(pos, size * (3 + nblocks))
+    sizes = np.frombuffer(header, headerType, nblocks, 3 * size).astype(np.int64)
+    data, _ = decode(pos, int(sizes.sum()))
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    return b''.join(decompress(bytes(data[offsets[i]:offsets[i + 1]])) for i in range(nblocks))
+
+
+def loadVtk(path, columns=None, dtype=float):
+    """
+    Loads XML VTK PolyData (*.vtp) or UnstructuredGrid (*.vtu) file into the same dictionary of columns as loadData
+    produces (points as Points:0, Points:1, Points:2, vector point data components as U:0, U:1, ...). Binary arrays
+    (raw appended, base64 appended or inline, optionally zlib or lzma compressed) are decoded straight into numpy
+    buffers, only arrays needed for requested columns are decoded. Does not require VTK library. Cell data is ignored
+    :param columns: names of columns to return, if None all point columns are returned
+    :param dtype: floating point type of returned columns
+    """
+    import mmap
+    import re
+    import xml.etree.ElementTree as ET
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    appendedStart = mm.find(b'<AppendedData')
+    if appendedStart >= 0:
+        # the rest of the file is binary, only xml part before it is parsed
+        root = ET.fromstring(mm[:appendedStart] + b'</VTKFile>')
+        tag = mm[appendedStart:mm.find(b'>', appendedStart) + 1]
+        appendedBase64 = re.search(br'encoding="base64"', tag) is not None
+        appended = memoryview(mm)[mm.find(b'_', appendedStart + len(tag)) + 1:]
+    else:
+        root = ET.fromstring(mm[:])
+        appendedBase64 = False
+        appended = None
+
+    order = '<' if root.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+    headerType = np.dtype(order + VTK_TYPES[root.get('header_type', 'UInt32')])
+    compressor = {'vtkZLibDataCompressor': 'zlib', 'vtkLZMADataCompressor': 'lzma'}.get(root.get('compressor'))
+    if root.get('compressor') and compressor is None:
+        raise Exception("Compressor {} of {} is not supported".format(root.get('compressor'), path))
+
+    def decodeArray(array):
+        arrayType = np.dtype(order + VTK_TYPES[array.get('type')])
+        fmt = array.get('format')
+        if fmt == 'ascii':
+            values = np.fromstring(array.text or '', dtype=arrayType, sep=' ')
+        elif fmt == 'appended':
+            values = np.frombuffer(vtkBlock(appended, int(array.get('offset')), headerType, compressor,
+                                            appendedBase64), arrayType)
+        else:
+            text = re.sub(br'\s', b'', (array.text or '').encode('ascii'))
+            values = np.frombuffer(vtkBlock(text, 0, headerType, compressor, True), arrayType)
+        return values.reshape(-1, int(array.get('NumberOfComponents', 1)))
+
+    pieces = []
+    for piece in root.iter('Piece'):
+        arrays = dict()
+        points = piece.find('Points/DataArray')
+        if points is not None:
+            arrays['Points'] = points
+        pointData = piece.find('PointData')
+        for array in (pointData if pointData is not None else []):
+            if array.tag == 'DataArray':
+                arrays[array.get('Name')] = array
+        pieces.append(arrays)
+
+    names = []
+    for name, array in (pieces[0].items() if pieces else []):
+        ncomp = int(array.get('NumberOfComponents', 1))
+        names += [name] if ncomp == 1 else ["{}:{}".format(name, c) for c in range(ncomp)]
+    if columns is None:
+        columns = names
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise KeyError("Columns {} not found in {}, available columns: {}".format(missing, path, ', '.join(names)))
+
+    # components of the same array are sliced from one decoded buffer
+    decodedArrays = dict()
+
+    def pieceArray(i, name):
+        if (i, name) not in decodedArrays:
+            decodedArrays[(i, name)] = decodeArray(pieces[i][name])
+        return decodedArrays[(i, name)]
+
+    res = dict()
+    for c in columns:
+        name, comp = (c, 0) if c in pieces[0] else c.rsplit(':', 1)
+        decoded = [pieceArray(i, name)[:, int(comp)] for i in range(len(pieces))]
+        res[c] = (decoded[0] if len(decoded) == 1 else np.concatenate(decoded)).astype(dtype, copy=False)
+    return res
+
+
+def isSetsPath(path):
+    """
+    Checks if path points to OpenFOAM sample sets (time directory or raw/xy file) rather than ParaView csv file
+    """
+    import os
+    return os.path.isdir(path) or os.path.splitext(path)[1] in ('.xy', '.raw', '.dat')
+
+
+def loadAnyData(path, cache=False, columns=None, dtype=float, chunkSize=None, chunkFilter=None, axis='xyz'):
+    """
+    Loads data with reader matching the path: OpenFOAM sample sets (see loadSets), XML VTK files (see loadVtk) or
+    ParaView csv (see loadData).
+    Parameters which do not apply to the reader (cache, chunkSize) are ignored, chunkFilter is always applied
+    :param axis: see loadSets
+    """
+    import os
+
+    if isSetsPath(path) or os.path.splitext(path)[1] in VTK_EXTENSIONS:
+        if isSetsPath(path):
+            data = loadSets(path, columns, dtype, axis)
+        else:
+            data = loadVtk(path, columns, dtype)
+        return chunkFilter(data) if chunkFilter is not None else data
+    return loadData(path, cache, columns, dtype, chunkSize, chunkFilter)
+
+
+def samplingWindowMask(samplCoords, ymin=None, ymax=None):
+    """
+    Returns boolean mask of points with sampling coordinate inside [ymin, ymax] range, limits which are not set
+    are ignored
+    """
+    import numpy as np
+
+    mask = np.ones(len(samplCoords), dtype=bool)
+    if ymin:
+        mask &= samplCoords >= ymin
+    if ymax:
+        mask &= samplCoords <= ymax
+    return mask
+
+
+class ProfileWindow:
+    """
+    Chunk filter for loadData which keeps only points that will be plotted: points inside [ymin, ymax] sampling
+    range get their spacing coordinate rounded, all other points are dropped. Range of the field values and the
+    two smallest spacing coordinates of lines are tracked over all points, including dropped ones, so that
+    autoscaling (see fieldRanges and lineSpacing) gives the same result as for fully loaded data. Spacing is not
+    tracked when precision is None (lines detected by clustering)
+    """
+    def __init__(self, dirX, dirY, precision, ymin=None, ymax=None, fields=()):
+        self.spacingDir = "Points:{}".format(dirX)
+        self.samplingDir = "Points:{}".format(dirY)
+        self.precision = precision
+        self.ymin = ymin
+        self.ymax = ymax
+        self.fields = fields
+        self.fieldRanges = dict()
+        # sorted unique rounded spacing coordinates, at most two smallest ones
+        self.spacingValues = []
+
+    @property
+    def lineSpacing(self):
+        """
+        distance of the first two sampling lines, None if less than two lines were seen
+        """
+        if len(self.spacingValues) < 2:
+            return None
+        return self.spacingValues[1] - self.spacingValues[0]
+
+    def trackSpacing(self, spacingCoords):
+        if not len(spacingCoords):
+            return
+        smallest = spacingCoords.min()
+        above = spacingCoords[spacingCoords > smallest]
+        values = [smallest] + ([above.min()] if len(above) else [])
+        self.spacingValues = sorted(set(self.spacingValues + [float(v) for v in values]))[:2]
+
+    def __call__(self, chunk):
+        import numpy as np
+
+        for var in self.fields:
+            if not len(chunk[var]):
+                continue
+            fmin, fmax = chunk[var].min(), chunk[var].max()
+            if var in self.fieldRanges:
+                fmin, fmax = min(fmin, self.fieldRanges[var][0]), max(fmax, self.fieldRanges[var][1])
+            self.fieldRanges[var] = (fmin, fmax)
+
+        mask = samplingWindowMask(chunk[self.samplingDir], self.ymin, self.ymax)
+        res = dict((n, v[mask]) for n, v in chunk.items())
+        if self.precision is not None:
+            spacingCoords = chunk[self.spacingDir]
+            if self.precision:
+                spacingCoords = np.round(spacingCoords, self.precision)
+            self.trackSpacing(spacingCoords)
+            res[self.spacingDir] = spacingCoords[mask]
+        return res
+
+
+def clusterTolerance(sortedCoords, minRatio=10.):
+    """
+    Estimates tolerance separating scatter of points lying on the same sampling line from spacing between lines.
+    Positive gaps between sorted coordinates are sorted and the largest jump (ratio of subsequent gaps) is searched.
+    If it exceeds minRatio, tolerance is set in the middle of the jump (geometric mean), otherwise all gaps are
+    considered as spacing between lines and tolerance is half of the smallest gap
+    :param sortedCoords: sorted spacing coordinates
+    """
+    import numpy as np
+
+    gaps = np.diff(sortedCoords)
+    gaps = np.sort(gaps[gaps > 0])
+    if len(gaps) == 0:
+        return 0.
+
+    if len(gaps) > 1:
+        ratios = gaps[1:] / gaps[:-1]
+        jump = np.argmax(ratios)
+        if ratios[jump] >= minRatio:
+            return np.sqrt(gaps[jump] * gaps[jump + 1])
+
+    return gaps[0] / 2
+
+
+def clusterCoordinates(coords, tolerance='auto'):
+    """
+    Clusters 1D coordinates: after sorting, cluster is broken wherever gap between subsequent coordinates exceeds
+    tolerance. Unlike rounding, coordinates scattered around a rounding boundary are never split into two clusters.
+    :param coords: spacing coordinates of points
+    :param tolerance: maximal gap inside cluster, or "auto" to estimate it with clusterTolerance
+    :return: array of coordinates replaced by the mean coordinate of their cluster
+    """
+    import numpy as np
+
+    coords = np.asarray(coords)
+    if len(coords) == 0:
+        return coords
+
+    order = np.argsort(coords, kind='mergesort')
+    sortedCoords = coords[order]
+    if tolerance == 'auto':
+        tolerance = clusterTolerance(sortedCoords)
+
+    sortedLabels = np.concatenate(([0], np.cumsum(np.diff(sortedCoords) > tolerance)))
+    labels = np.empty_like(sortedLabels)
+    labels[order] = sortedLabels
+
+    centers = np.bincount(labels, coords) / np.bincount(labels)
+    return centers[labels]
+
+
+def groupSamplingLines(spacingCoords, samplCoords, ymin=None, ymax=None):
+    """
+    Groups points into sampling lines in a single pass. Points sharing the same spacing coordinate form one line,
+    inside the line points are ordered along sampling direction (ties keep the input order).
+    :param spacingCoords: array of (already rounded) spacing coordinates
+    :param samplCoords: array of sampling direction coordinates
+    :param ymin: points with sampling coordinate below this value are skipped (ignored if not set)
+    :param ymax: points with sampling coordinate above this value are skipped (ignored if not set)
+    :return: tuple (spacingValues, lineIds, order, bounds) where spacingValues are sorted unique spacing
+             coordinates, lineIds maps each point to its line, order contains indices of points grouped by line and
+             sorted along line, and order[bounds[i]:bounds[i+1]] selects points of i-th line
+    """
+    import numpy as np
+
+    spacingCoords = np.asarray(spacingCoords)
+    samplCoords = np.asarray(samplCoords)
+
+    spacingValues, lineIds = np.unique(spacingCoords, return_inverse=True)
+    lineIds = lineIds.reshape(-1)
+
+    selected = np.flatnonzero(samplingWindowMask(samplCoords, ymin, ymax))
+    # lexsort is stable, so primary key is line id and secondary coordinate along the line
+    order = selected[np.lexsort((samplCoords[selected], lineIds[selected]))]
+
+    bounds = np.zeros(len(spacingValues) + 1, dtype=int)
+    bounds[1:] = np.cumsum(np.bincount(lineIds[selected], minlength=len(spacingValues)))
+
+    return spacingValues, lineIds, order, bounds
+
+
+def splitSegments(coords, gapFactor=3., bounds=None):
+    """
+    Finds continuous segments of sampling lines. Line is broken wherever spacing between subsequent points exceeds
+    gapFactor times the average spacing of the line, the first spacing of the line and spacings following coincident
+    points never break it. All lines are processed in one vectorized pass.
+    :param coords: coordinates of points along sampling direction, sorted within each line
+    :param bounds: coords[bounds[i]:bounds[i+1]] are points of i-th line, by default all points form single line
+    :return: integer array of shape (n, 2), each row holds [start, end) index range of one segment, segments of
+             empty lines are skipped
+    """
+    import numpy as np
+
+    coords = np.asarray(coords)
+    n = len(coords)
+    if bounds is None:
+        bounds = [0, n]
+    bounds = np.asarray(bounds)
+    counts = np.diff(bounds)
+
+    lineOfPoint = np.repeat(np.arange(len(counts)), counts)
+    dist = np.diff(coords)
+    inLine = lineOfPoint[1:] == lineOfPoint[:-1]
+
+    # sum of spacings within line divided by their count
+    avgDist = np.bincount(lineOfPoint[1:][inLine], dist[inLine], minlength=len(counts)) / np.maximum(counts - 1, 1)
+
+    # spacing i (between points i and i+1) breaks the line if it is too large and preceding spacing of the same line
+    # is non zero
+    isBreak = inLine & (dist > gapFactor * avgDist[lineOfPoint[:-1]])
+    isBreak[1:] &= inLine[:-1] & (dist[:-1] != 0)
+    isBreak[:1] = False
+    breaks = np.flatnonzero(isBreak) + 1
+
+    offsets = np.union1d(bounds, breaks)
+    return np.column_stack((offsets[:-1], offsets[1:]))
+
+
+def profileIndex(data, dirX, dirY, precision, ymin=None, ymax=None, gapFactor=3., tolerance=None):
+    """
+    Computes field independent part of profiles extraction: grouping of points into sampling lines, their order and
+    segments. Index can be computed once and reused for all fields of the same data, see extractProfiles.
+    :param data: dictionary of columns, see loadData
+    :param dirX: profiles spacing direction (0, 1 or 2)
+    :param dirY: sampling line direction (0, 1 or 2)
+    :param precision: number of decimals spacing coordinates are rounded to before grouping, None disables rounding
+    :param ymin: points with sampling coordinate below this value are skipped (ignored if not set)
+    :param ymax: points with sampling coordinate above this value are skipped (ignored if not set)
+    :param gapFactor: see splitSegments
+    :param tolerance: if set, lines are detected with clusterCoordinates using this tolerance (number or "auto")
+                      instead of rounding to precision
+    :return: dictionary with keys:
+             "lines" - spacing coordinates of lines,
+             "lineOffsets" - points of i-th line are stored at [lineOffsets[i], lineOffsets[i+1]) range of buffers,
+             "segmentOffsets" - same for continuous segments of lines,
+             "segmentLines" - index of line each segment belongs to,
+             "coords" - sampling coordinates of points,
+             "indices" - indices of points in data columns,
+             "setup" - parameters the index was computed with
+    """
+    import numpy as np
+
+    samplCoords = np.asarray(data["Points:{}".format(dirY)])
+    spacingCoords = np.asarray(data["Points:{}".format(dirX)])
+
+    # round spacing coords so that unique will be able to distinguish points collections with similar spacing coordinate
+    with stage('rounding'):
+        if tolerance is not None:
+            spacingCoords = clusterCoordinates(spacingCoords, tolerance)
+        elif precision:
+            spacingCoords = np.round(spacingCoords, precision)
+
+    with stage('grouping'):
+        spacingValues, lineIds, order, bounds = groupSamplingLines(spacingCoords, samplCoords, ymin, ymax)
+        coords = samplCoords[order]
+    with stage('segmenting'):
+        segments = splitSegments(coords, gapFactor, bounds)
+
+    return {'lines': spacingValues,
+            'lineOffsets': bounds,
+            'segmentOffsets': np.append(segments[:, 0], bounds[-1]),
+            'segmentLines': lineIds[order[segments[:, 0]]],
+            'coords': coords,
+            'indices': order,
+            'setup': (dirX, dirY, precision, ymin, ymax, gapFactor, tolerance, len(samplCoords))}
+
+
+def extractProfiles(data, dirX, dirY, var, precision, ymin=None, ymax=None, gapFactor=3., index=None,
+                    tolerance=None):
+    """
+    Extracts profiles of the field along sampling lines, without any plotting. Profiles are returned as compact
+    flat buffers, points of each line are sorted along sampling direction.
+    :param var: name of field column
+    :param index: result of profileIndex for the same data and parameters, computed if not given
+    :return: profileIndex dictionary extended with "values" - field values of points.
+             See profileIndex for other parameters
+    """
+    import numpy as np
+
+    setup = (dirX, dirY, precision, ymin, ymax, gapFactor, tolerance, len(data["Points:{}".format(dirY)]))
+    if index is None:
+        index = profileIndex(data, dirX, dirY, precision, ymin, ymax, gapFactor, tolerance)
+    elif index['setup'] != setup:
+        raise Exception("Profile index was computed for different data or parameters")
+
+    res = dict(index)
+    res['values'] = np.asarray(data[var])[index['indices']]
+    return res
+
+
+def profileStatistics(profiles):
+    """
+    Computes statistics of each line of extracted profiles in one vectorized pass
+    :param profiles: result of extractProfiles
+    :return: dictionary of per line arrays: "count", "min", "max", "mean" and "integral" (trapezoidal integral of the
+             field along sampling direction, gaps between segments are not integrated). Statistics of empty lines are NaN
+    """
+    import numpy as np
+
+    bounds = profiles['lineOffsets']
+    segmentOffsets = profiles['segmentOffsets']
+    coords = profiles['coords']
+    values = profiles['values']
+
+    counts = np.diff(bounds)
+    nLines = len(counts)
+    nonEmpty = counts > 0
+    lineOfPoint = np.repeat(np.arange(nLines), counts)
+    segmentOfPoint = np.repeat(np.arange(len(segmentOffsets) - 1), np.diff(segmentOffsets))
+
+    res = {'count': counts}
+    for name, ufunc in (('min', np.minimum), ('max', np.maximum)):
+        res[name] = np.full(nLines, np.nan)
+        if len(values):
+            res[name][nonEmpty] = ufunc.reduceat(values, bounds[:-1][nonEmpty])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        res['mean'] = np.bincount(lineOfPoint, values, minlength=nLines) / counts
+
+    inSegment = segmentOfPoint[1:] == segmentOfPoint[:-1]
+    trapezoids = 0.5 * (values[1:] + values[:-1]) * np.diff(coords)
+    res['integral'] = np.bincount(lineOfPoint[1:][inSegment], trapezoids[inSegment], minlength=nLines).astype(float)
+    res['integral'][~nonEmpty] = np.nan
+
+    return res
+
+
+def decimateProfiles(profiles, resolution):
+    """
+    Shape preserving decimation of extracted profiles (min/max per bin). Each segment is divided into resolution
+    bins of equal length along sampling direction and in each bin only the first, the last, the minimal and the
+    maximal value is kept, so peaks survive while number of points per segment is bounded by 4*resolution.
+    Segments which already have less points are kept intact. All segments are processed in one vectorized pass.
+    :param profiles: result of extractProfiles or extractProbeProfiles
+    :param resolution: number of bins per segment, e.g. height of the figure in pixels
+    :return: profiles dictionary of the same layout holding only kept points
+    """
+    import numpy as np
+
+    coords = profiles['coords']
+    values = profiles['values']
+    offsets = profiles['segmentOffsets']
+    lengths = np.diff(offsets)
+    if len(coords) == 0:
+        return profiles
+    segmentOfPoint = np.repeat(np.arange(len(lengths)), lengths)
+
+    first = coords[offsets[:-1][lengths > 0]]
+    last = coords[offsets[1:][lengths > 0] - 1]
+    start = np.zeros(len(lengths))
+    span = np.ones(len(lengths))
+    start[lengths > 0] = first
+    span[lengths > 0] = np.where(last > first, last - first, 1.)
+
+    bins = np.floor((coords - start[segmentOfPoint]) / span[segmentOfPoint] * resolution).astype(int)
+    bins = np.clip(bins, 0, resolution - 1)
+    # short segments: each point gets its own bin, so it is always kept
+    short = (lengths <= 4 * resolution)[segmentOfPoint]
+    bins[short] = np.arange(len(coords))[short] - offsets[segmentOfPoint[short]]
+
+    # points are sorted along segments, so bins form contiguous runs
+    key = segmentOfPoint.astype(np.int64) * max(resolution, lengths.max()) + bins
+    runStarts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+    runEnds = np.append(runStarts[1:], len(key)) - 1
+
+    byValue = np.lexsort((values, key))
+    keep = np.unique(np.concatenate((runStarts, runEnds, byValue[runStarts], byValue[runEnds])))
+
+    res = dict(profiles)
+    for name in ('coords', 'values', 'indices', 'points', 'neighbours', 'weights'):
+        if name in res:
+            res[name] = res[name][keep]
+    for name in ('lineOffsets', 'segmentOffsets'):
+        res[name] = np.searchsorted(keep, res[name])
+    return res
+
+
+def probeIndex(data, probes, samples=100, neighbours=4, maxDistance=None):
+    """
+    Computes field independent part of sampling along arbitrary line segments: sample points, their nearest data
+    points and interpolation weights. KD-tree over data points is built once and all samples of all segments are
+    queried in one batch. Requires scipy.
+    :param data: dictionary of columns, see loadData. All available "Points:0", "Points:1", "Points:2" columns are used
+    :param probes: array of shape (n, 6), each row holds x0, y0, z0, x1, y1, z1 coordinates of segment ends
+    :param samples: number of samples along each segment
+    :param neighbours: number of nearest points used in inverse distance weighted interpolation
+    :param maxDistance: samples with no data point closer than that are set to NaN (not checked if None)
+    :return: dictionary with keys:
+             "lineOffsets" - samples of i-th segment are stored at [lineOffsets[i], lineOffsets[i+1]) range of buffers,
+             "segmentOffsets", "segmentLines" - the same as in profileIndex, each segment is single continuous line,
+             "coords" - distance of samples from segment start,
+             "points" - sample coordinates, array of shape (n, 3),
+             "neighbours", "weights" - indices of data points and their weights used for each sample
+    """
+    import numpy as np
+    from scipy.spatial import cKDTree
+
+    probes = np.asarray(probes, dtype=float).reshape(-1, 6)
+    dims = [i for i in range(3) if "Points:{}".format(i) in data]
+    xyz = np.column_stack([data["Points:{}".format(i)] for i in dims])
+
+    t = np.linspace(0., 1., samples)
+    start, end = probes[:, :3], probes[:, 3:]
+    points = (start[:, np.newaxis, :] + t[np.newaxis, :, np.newaxis] * (end - start)[:, np.newaxis, :]).reshape(-1, 3)
+    coords = (t[np.newaxis, :] * np.linalg.norm(end - start, axis=1)[:, np.newaxis]).reshape(-1)
+
+    k = max(1, min(neighbours, len(xyz)))
+    dist, ids = cKDTree(xyz).query(points[:, dims], k=k)
+    dist = dist.reshape(len(points), k)
+    ids = ids.reshape(len(points), k)
+
+    with np.errstate(divide='ignore'):
+        weights = 1. / dist ** 2
+    # samples lying exactly at data point take its value
+    exact = dist[:, 0] == 0
+    weights[exact] = 0.
+    weights[exact, 0] = 1.
+    weights /= weights.sum(axis=1)[:, np.newaxis]
+    if maxDistance is not None:
+        weights[dist[:, 0] > maxDistance] = np.nan
+
+    bounds = np.arange(len(probes) + 1) * samples
+    return {'lineOffsets': bounds,
+            'segmentOffsets': bounds,
+            'segmentLines': np.arange(len(probes)),
+            'coords': coords,
+            'points': points,
+            'neighbours': ids,
+            'weights': weights}
+
+
+def extractProbeProfiles(data, var, probes, samples=100, neighbours=4, maxDistance=None, index=None):
+    """
+    Extracts profiles of the field along arbitrary line segments by interpolation from the nearest data points,
+    see probeIndex for parameters. Result is compatible with profileStatistics.
+    :param var: name of field column
+    :param index: result of probeIndex for the same data and parameters, computed if not given
+    :return: probeIndex dictionary extended with "values" - interpolated field values of samples
+    """
+    import numpy as np
+
+    if index is None:
+        index = probeIndex(data, probes, samples, neighbours, maxDistance)
+
+    res = dict(index)
+    res['values'] = (np.asarray(data[var])[index['neighbours']] * index['weights']).sum(axis=1)
+    return res
+
+
+def joinSegments(segments):
+    """
+    Joins (n, 2) arrays of segments into single array, consecutive segments are separated with NaN row so that they are
+    drawn as one broken line
+    """
+    import numpy as np
+
+    gap = np.full((1, 2), np.nan)
+    return np.concatenate([p for segment in segments for p in (segment, gap)] or [np.empty((0, 2))])
+
+
+def drawProfiles(profiles, refLines, pltDescription):
+    """
+    Draws all profile segments and all reference lines in the current axes, each group as a single artist, so that
+    rendering cost does not grow with number of lines.
+    :param profiles: list of (n, 2) arrays with x, y coordinates of profile segments
+    :param refLines: list of [(x0, y0), (x1, y1)] reference line segments
+    :param pltDescription: see plot
+    :return: artist drawing the profiles (LineCollection, or Line2D when markers are used), None if there are none
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+
+    ax = plt.gca()
+    artist = None
+
+    if refLines:
+        ax.add_collection(LineCollection(refLines, colors='k', linewidths=0.4, linestyles=[(0, (10, 20))]))
+
+    if profiles:
+        # resolve matplotlib format string ("-b", ".k", ...) through a temporary line
+        template, = ax.plot([], [], pltDescription['type'], marker=pltDescription['marker'],
+                            linewidth=pltDescription['linewidth'], markersize=3)
+        template.remove()
+
+        if template.get_marker() in (None, '', ' ', 'None') and template.get_linestyle() not in ('', ' ', 'None'):
+            artist = ax.add_collection(LineCollection(profiles, colors=[template.get_color()],
+                                                      linewidths=template.get_linewidth(),
+                                                      linestyles=template.get_linestyle()))
+        else:
+            # LineCollection can't draw markers, join segments into one line broken with NaN instead
+            xy = joinSegments(profiles)
+            artist, = ax.plot(xy[:, 0], xy[:, 1], pltDescription['type'], marker=pltDescription['marker'],
+                              linewidth=pltDescription['linewidth'], markersize=3)
+
+    ax.autoscale_view()
+    return artist
+
+
+def plot(data, dirX, dirY, var, precision, axesConfig, pltDescription, useAutoscaling, fieldRange=None, index=None,
+         tolerance=None, resolution=None, lineSpacing=None):
+    """
+    :param var: name of the field, or list of names to plot each field in separate panel of the figure
+    :param pltDescription: dictionary like object containing "type", "marker" and "linewidth" keys. Where type is
+           matplotlib line style, marker is marker style
+    :param fieldRange: (min, max) of the field used for autoscaling, by default computed from data. Required when
+           data was loaded with ProfileWindow filter, see ProfileWindow.fieldRanges. For several fields dictionary
+           mapping field name to its range
+    :param index: profileIndex of the data, pass it when plotting several fields of the same data in separate calls
+    :param tolerance: detect lines by clustering spacing coordinates instead of rounding them, see profileIndex
+    :param resolution: if set, profiles are decimated before drawing, see decimateProfiles
+    :param lineSpacing: distance of the first two sampling lines used for autoscaling, by default computed from data.
+           Required when data was loaded with ProfileWindow filter, see ProfileWindow.lineSpacing
+    :return: scale of the profiles, list of scales for several fields
+    """
+    import numpy as np
+    import matplotlib.pyplot as plt
+
+    if index is None:
+        index = profileIndex(data, dirX, dirY, precision, axesConfig['ymin'], axesConfig['ymax'], tolerance=tolerance)
+
+    if isinstance(var, (list, tuple)):
+        scales = []
+        for i, v in enumerate(var):
+            plt.subplot(1, len(var), i + 1)
+            plt.title(v)
+            scales.append(plot(data, dirX, dirY, v, precision, axesConfig, pltDescription, useAutoscaling,
+                               fieldRange.get(v) if fieldRange else None, index, tolerance, resolution, lineSpacing))
+        return scales
+
+    field = data[var]
+    with stage('extraction'):
+        profiles = extractProfiles(data, dirX, dirY, var, precision, axesConfig['ymin'], axesConfig['ymax'],
+                                   index=index, tolerance=tolerance)
+        if resolution:
+            profiles = decimateProfiles(profiles, resolution)
+    spacingValues = profiles['lines']
+
+    scale = axesConfig['scale']
+    totalScale = scale
+
+
+    if (len(spacingValues) > 1 or lineSpacing is not None) and useAutoscaling:
+        # normalize data to make sure profiles will not overlap
+        xdelta = lineSpacing if lineSpacing is not None else spacingValues[1] - spacingValues[0]
+        if fieldRange is not None:
+            fmin, fmax = fieldRange
+        else:
+            fmax = np.max(field)
+            fmin = np.min(field)
+        totalScale = (scale * xdelta / 2 / (fmax - fmin))
+
+    coords = profiles['coords']
+    values = profiles['values']
+    xs = values * totalScale + spacingValues[np.repeat(np.arange(len(spacingValues)), np.diff(profiles['lineOffsets']))]
+
+    segments = []
+    refLines = []
+    offsets = profiles['segmentOffsets']
+    for start, end, lineId in zip(offsets[:-1], offsets[1:], profiles['segmentLines']):
+        if pltDescription['refline']:
+            refLines.append([(spacingValues[lineId], coords[start]), (spacingValues[lineId], coords[end - 1])])
+        segments.append(np.column_stack((xs[start:end], coords[start:end])))
+
+    #Add ref value labels
+    if useAutoscaling and pltDescription['labels']:
+        bounds = profiles['lineOffsets']
+        for lineCoord, first, last in zip(spacingValues, bounds[:-1], bounds[1:] - 1):
+            if last < first:
+                continue
+            separtion = (coords[last] - coords[first]) / 20
+            plt.text(lineCoord, coords[last] + separtion, "0")
+            plt.text(xs[last], coords[last] + separtion, "{0:.1f}".format(values[last]))
+
+    with stage('drawing'):
+        drawProfiles(segments, refLines, pltDescription)
+        finishAxes(axesConfig, pltDescription)
+
+    return totalScale
+
+
+def finishAxes(axesConfig, pltDescription):
+    """
+    Applies grid, equal aspect ratio and axes limits to current axes
+    """
+    import matplotlib.pyplot as plt
+
+    if pltDescription['grid']:
+        plt.grid()
+
+    plt.axis('equal')
+
+    if axesConfig['xmin'] is not None or axesConfig['xmax'] is not None:
+        s = axesConfig['xmin'] if axesConfig['xmin'] is not None else plt.xlim()[0]
+        e = axesConfig['xmax'] if axesConfig['xmax'] is not None else plt.xlim()[1]
+        plt.xlim(s, e)
+
+    if axesConfig['ymin'] is not None or axesConfig['ymax'] is not None:
+        s = axesConfig['ymin'] if axesConfig['ymin'] is not None else plt.ylim()[0]
+        e = axesConfig['ymax'] if axesConfig['ymax'] is not None else plt.ylim()[1]
+        plt.ylim(s, e)
+
+
+def plotProbes(data, dirX, dirY, var, probes, axesConfig, pltDescription, useAutoscaling, fieldRange=None, index=None,
+               samples=100):
+    """
+    Plots profiles of the field sampled along arbitrary line segments, see extractProbeProfiles. Each profile is drawn
+    along its segment projected on (dirX, dirY) plane, with field values as offsets in the direction normal to the
+    segment (for a segment along dirY it is the same as for plot).
+    :param probes: array of shape (n, 6), each row holds x0, y0, z0, x1, y1, z1 coordinates of segment ends
+    :param index: probeIndex of the data, pass it when plotting several fields of the same data in separate calls
+    :param samples: number of samples along each segment
+    :return: scale of the profiles
+    See plot for other parameters
+    """
+    import numpy as np
+    import matplotlib.pyplot as plt
+
+    probes = np.asarray(probes, dtype=float).reshape(-1, 6)
+    with stage('extraction'):
+        profiles = extractProbeProfiles(data, var, probes, samples, index=index)
+
+    start = probes[:, [dirX, dirY]]
+    end = probes[:, [3 + dirX, 3 + dirY]]
+    tangent = end - start
+    tangent /= np.maximum(np.hypot(tangent[:, 0], tangent[:, 1]), 1e-300)[:, np.newaxis]
+    normal = np.column_stack((tangent[:, 1], -tangent[:, 0]))
+
+    scale = axesConfig['scale']
+    totalScale = scale
+
+    if len(probes) > 1 and useAutoscaling:
+        # normalize data to make sure profiles of the closest segments will not overlap
+        middle = 0.5 * (start + end)
+        dist = np.hypot(*(middle[:, np.newaxis, :] - middle[np.newaxis, :, :]).transpose(2, 0, 1))
+        spacing = dist[dist > 0].min() if np.any(dist > 0) else 1.
+        if fieldRange is not None:
+            fmin, fmax = fieldRange
+        else:
+            fmin, fmax = np.nanmin(profiles['values']), np.nanmax(profiles['values'])
+        totalScale = (scale * spacing / 2 / (fmax - fmin))
+
+    bounds = profiles['lineOffsets']
+    lineOfPoint = np.repeat(np.arange(len(probes)), np.diff(bounds))
+    points = profiles['points'][:, [dirX, dirY]]
+    xy = points + normal[lineOfPoint] * (profiles['values'] * totalScale)[:, np.newaxis]
+
+    segments = []
+    refLines = []
+    for lineId, (first, last) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if pltDescription['refline']:
+            refLines.append([tuple(start[lineId]), tuple(end[lineId])])
+        segments.append(xy[first:last])
+
+        if useAutoscaling and pltDescription['labels'] and last > first:
+            plt.text(xy[last - 1, 0], xy[last - 1, 1], "{0:.1f}".format(profiles['values'][last - 1]))
+
+    with stage('drawing'):
+        drawProfiles(segments, refLines, pltDescription)
+        finishAxes(axesConfig, pltDescription)
+
+    return totalScale
+
+
+def thinPoints(xy, cellSize):
+    """
+    Pre-thins point cloud on regular grid: only first point of each grid cell is kept
+    :param xy: array of shape (n, 2)
+    :param cellSize: size of grid cell
+    :return: thinned points
+    """
+    import numpy as np
+
+    cells = np.floor((xy - xy.min(axis=0)) / cellSize).astype(np.int64)
+    _, kept = np.unique(cells, axis=0, return_index=True)
+    return xy[np.sort(kept)]
+
+
+def concaveOutline(xy, alphaRadius):
+    """
+    Computes concave (alpha shape) outline of point cloud: Delaunay triangles with circumradius larger than alphaRadius
+    are removed and edges belonging to only one of the remaining triangles are chained into closed polygons
+    :return: list of closed polygons, arrays of shape (n, 2)
+    """
     import numpy as np
-    pureData = np.loadtxt(path, skiprows=1, delimiter=',').T
-    with open(path, 'r') as f:
-        names = f.readline().replace('"', '').replace('\n', '').split(',')
-    res = dict()
-    for i, n in enumerate(names):
-        res[n] = pureData[i]
-    return res
+    from scipy.spatial import Delaunay
+
+    tri = Delaunay(xy).simplices
+    a, b, c = xy[tri[:, 0]], xy[tri[:, 1]], xy[tri[:, 2]]
+    la, lb, lc = np.hypot(*(b - c).T), np.hypot(*(c - a).T), np.hypot(*(a - b).T)
+    area = 0.5 * np.abs((b - a)[:, 0] * (c - a)[:, 1] - (b - a)[:, 1] * (c - a)[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = la * lb * lc / (4 * area)
+    tri = tri[radius <= alphaRadius]
 
+    edges = np.sort(np.concatenate((tri[:, [0, 1]], tri[:, [1, 2]], tri[:, [2, 0]])), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    boundary = edges[counts == 1]
 
-def plot(data, dirX, dirY, var, precision, axesConfig, pltDescription, useAutoscaling):
+    neighbours = dict()
+    for i, j in boundary:
+        neighbours.setdefault(i, []).append(j)
+        neighbours.setdefault(j, []).append(i)
+
+    polygons = []
+    while neighbours:
+        start = next(iter(neighbours))
+        ring = [start]
+        prev, current = None, start
+        while True:
+            candidates = neighbours.get(current, [])
+            nxt = next((n for n in candidates if n != prev), None)
+            if nxt is None:
+                break
+            candidates.remove(nxt)
+            neighbours[nxt].remove(current)
+            for v in (current, nxt):
+                if not neighbours[v]:
+                    del neighbours[v]
+            prev, current = current, nxt
+            ring.append(current)
+            if current == start:
+                break
+        if len(ring) > 3:
+            polygons.append(xy[ring])
+    return polygons
+
+
+def geometryOutline(data, xdir, ydir, alphaRadius=None, cellSize=None):
     """
-    :param pltDescription: dictionary like object containing "type", "marker" and "linewidth" keys. Where type is
-           matplotlib line style, marker is marker style
+    Computes outline of the reference geometry
+    :param alphaRadius: if set, concave outline is computed (see concaveOutline), convex hull otherwise
+    :param cellSize: if set, points are pre-thinned on grid of that size (see thinPoints)
+    :return: list of closed polygons, arrays of shape (n, 2)
     """
-    field = data[var]
-    samplingDir = "Points:{}".format(dirY)
-    spacingDir = "Points:{}".format(dirX)
+    import numpy as np
+    from scipy.spatial import ConvexHull
 
+    xy = np.column_stack((data["Points:{}".format(xdir)], data["Points:{}".format(ydir)])).astype(float)
+    if cellSize:
+        xy = thinPoints(xy, cellSize)
+
+    if alphaRadius:
+        return concaveOutline(xy, alphaRadius)
+
+    v = ConvexHull(xy).vertices
+    return [xy[np.append(v, v[0])]]
+
+
+def loadGeometryOutline(path, xdir, ydir, alphaRadius=None, cellSize=None, cache=False, dtype=float, chunkSize=None):
+    """
+    Loads only point coordinates of the reference geometry file and computes its outline, see geometryOutline
+    :param cache: if True, outline is stored in sidecar file (*.outline.json) next to the geometry file and reused
+                  as long as the file and outline parameters do not change
+    :return: list of closed polygons, arrays of shape (n, 2)
+    """
+    import json
+    import os
     import numpy as np
+
+    outlineFile = path + '.outline.json'
+    params = json.dumps([xdir, ydir, alphaRadius, cellSize])
+
+    entries = dict()
+    if cache and os.path.exists(outlineFile):
+        try:
+            with open(outlineFile, 'r') as f:
+                desc = json.load(f)
+            if desc['key'] == cacheKey(path):
+                entries = desc['outlines']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        if params in entries:
+            return [np.array(p) for p in entries[params]]
+
+    with stage('parsing'):
+        geom = loadAnyData(path, cache, ["Points:{}".format(xdir), "Points:{}".format(ydir)], dtype, chunkSize)
+    with stage('hull'):
+        outline = geometryOutline(geom, xdir, ydir, alphaRadius, cellSize)
+
+    if cache:
+        entries[params] = [p.tolist() for p in outline]
+        try:
+            with open(outlineFile + '.tmp', 'w') as f:
+                json.dump({'key': cacheKey(path), 'outlines': entries}, f)
+            os.rename(outlineFile + '.tmp', outlineFile)
+        except (IOError, OSError):
+            print("Can't write outline cache for {}".format(path))
+
+    return outline
+
+
+def plotGeometry(data, xdir, ydir, alphaRadius=None, cellSize=None, outline=None):
+    """
+    Draws reference geometry as filled outline, see geometryOutline
+    :param outline: precomputed outline polygons (e.g. from loadGeometryOutline), data is not used if given
+    """
     import matplotlib.pyplot as plt
 
-    samplCoords = data[samplingDir]
-    spacingCoords = data[spacingDir]
+    if outline is None:
+        outline = geometryOutline(data, xdir, ydir, alphaRadius, cellSize)
 
-    # round spacing coords so that unique will be able to distinguish points collections with similar spacing coordinate
-    if precision:
-        spacingCoords = map(lambda d: np.round(d, precision), spacingCoords)
+    for xy in outline:
+        plt.fill(xy[:, 0], xy[:, 1], 'lightgray')
 
-    spacingValues = sorted(np.unique(spacingCoords, return_index=True)[0])
 
-    scale = axesConfig['scale']
-    totalScale = scale
+class ProfileViewer:
+    """
+    Interactive figure for tuning profiles scale, sampling range and field without reloading the data. Grouping index
+    is computed once for the whole sampling range, profiles of each field are extracted once, and adjustments only
+    replace data of the existing profiles artist, which is redrawn with blitting. Sampling range is applied as axes
+    limits. Controls: scale and range sliders, field buttons, keys "+"/"-" (scale), "n"/"p" (next/previous field),
+    up/down (shift range), "r" (reset)
+    """
+    def __init__(self, data, dirX, dirY, fields, precision, axesConfig, pltDescription, fieldRanges=None,
+                 tolerance=None, resolution=None, outline=None, lineSpacing=None):
+        """
+        :param fields: list of field names
+        :param outline: reference geometry outline polygons drawn below the profiles, see loadGeometryOutline
+        See plot for other parameters
+        """
+        self.data = data
+        self.fields = list(fields)
+        self.fieldRanges = fieldRanges or dict()
+        self.lineSpacing = lineSpacing
+        self.resolution = resolution
+        self.axesConfig = dict(axesConfig)
+        self.pltDescription = pltDescription
+        self.outline = outline
+        self.setup = (dirX, dirY, precision, tolerance)
+        self.index = profileIndex(data, dirX, dirY, precision, tolerance=tolerance)
+        self.profiles = dict()
 
+        coords = self.index['coords']
+        self.coordRange = (float(coords.min()), float(coords.max())) if len(coords) else (0., 1.)
+        self.field = self.fields[0]
+        self.scale = axesConfig['scale']
+        self.ymin = axesConfig['ymin'] if axesConfig['ymin'] is not None else self.coordRange[0]
+        self.ymax = axesConfig['ymax'] if axesConfig['ymax'] is not None else self.coordRange[1]
+        self.background = None
+        self.artist = None
 
-    if len(spacingValues) > 1 and useAutoscaling:
-        # normalize data to make sure profiles will not overlap
-        xdelta = spacingValues[1] - spacingValues[0]
-        fmax = max(field)
-        fmin = min(field)
-        totalScale = (scale * xdelta / 2 / (fmax - fmin))
-        field_scaled = field * totalScale
-    else:
-        field_scaled = field * scale
-
-    ymin = axesConfig['ymin']
-    ymax = axesConfig['ymax']
-
-
-    for lineCoord in spacingValues:
-        lineData = []
-        fieldData = []
-        for i, v in enumerate(spacingCoords):
-            c = samplCoords[i]
-            if v == lineCoord:
-                if ymin and c < ymin:
-                    continue
-                if ymax and c > ymax:
-                    continue
-                lineData.append([c, field_scaled[i] + v])
-                fieldData.append(field[i])
-
-        lineData = np.array(lineData)
-        fieldData = np.array(fieldData)
-        sort = np.argsort(lineData[:, 0])
-        lineData = lineData[sort, :]
-        fieldData = fieldData[sort]
-
-        avgDist = 0
-        yprev = None
-
-        for p in lineData:
-            if yprev:
-                dst = p[0] - yprev
-                avgDist += dst
-            yprev = p[0]
-
-        avgDist /= len(lineData) - 1
-        lines = []
-        fields = []
-        line = []
-        lineField = []
-        lines.append(line)
-        fields.append(lineField)
-        prev = None
-        dst = None
-        for i, _ in enumerate(lineData):
-            c = lineData[i][0]
-            if prev:
-                newDst = c - prev
-                if dst and newDst > 3*avgDist:
-                    print newDst, dst
-                    line = []
-                    lineField = []
-                    lines.append(line)
-                    fields.append(lineField)
-                    dst = None
-                    prev = None
-                dst = newDst
-            prev = c
-            line.append(lineData[i])
-            lineField.append(fieldData[i])
-
-        for line in lines:
-            line = np.array(line)
-            sort = np.argsort(line[:, 0])
-            line = line[sort, :]
-            # fieldData = fieldData[sort]
-
-            if pltDescription['refline']:
-                plt.plot([lineCoord] * line.shape[0], line[:, 0], "--k", linewidth=0.4, dashes=(10, 20))
-            plt.plot(line[:, 1], line[:, 0], pltDescription['type'], marker=pltDescription['marker'], linewidth=pltDescription['linewidth'], markersize=3)
-
-        # lineData = np.array(lineData)
-        # fieldData = np.array(fieldData)
-
-        #Add ref value labels
-        if useAutoscaling and pltDescription['labels']:
-            separtion = (lineData[-1,0]-lineData[0, 0]) / 20
-            plt.text(lineCoord, lineData[-1,0] + separtion, "0")
-            plt.text(lineData[-1, 1], lineData[-1, 0]+separtion, "{0:.1f}".format(fieldData[-1]))
+    def fieldProfiles(self, field):
+        """
+        Extracted (and decimated) profiles of the field together with base line coordinate of each point and
+        autoscaling factor, computed once per field
+        """
+        import numpy as np
 
-    if pltDescription['grid']:
-        plt.grid()
+        if field not in self.profiles:
+            dirX, dirY, precision, tolerance = self.setup
+            with stage('extraction'):
+                profiles = extractProfiles(self.data, dirX, dirY, field, precision, index=self.index,
+                                           tolerance=tolerance)
+                if self.resolution:
+                    profiles = decimateProfiles(profiles, self.resolution)
 
-    plt.axis('equal')
+            lines = profiles['lines']
+            unitScale = 1.
+            if len(lines) > 1 or self.lineSpacing is not None:
+                fmin, fmax = self.fieldRanges.get(field) or (np.min(self.data[field]), np.max(self.data[field]))
+                xdelta = self.lineSpacing if self.lineSpacing is not None else lines[1] - lines[0]
+                unitScale = xdelta / 2 / (fmax - fmin)
+            profiles['base'] = lines[np.repeat(np.arange(len(lines)), np.diff(profiles['lineOffsets']))]
+            profiles['unitScale'] = unitScale
+            self.profiles[field] = profiles
+        return self.profiles[field]
 
-    if axesConfig['xmin'] is not None or axesConfig['xmax'] is not None:
-        s = axesConfig['xmin'] if axesConfig['xmin'] is not None else plt.xlim()[0]
-        e = axesConfig['xmax'] if axesConfig['xmax'] is not None else plt.xlim()[1]
-        plt.xlim(s, e)
+    def segments(self):
+        """
+        Profile segments of the current field and scale, list of (n, 2) arrays
+        """
+        import numpy as np
 
-    if axesConfig['ymin'] is not None or axesConfig['ymax'] is not None:
-        s = axesConfig['ymin'] if axesConfig['ymin'] is not None else plt.ylim()[0]
-        e = axesConfig['ymax'] if axesConfig['ymax'] is not None else plt.ylim()[1]
-        plt.ylim(s, e)
+        profiles = self.fieldProfiles(self.field)
+        xs = profiles['values'] * (self.scale * profiles['unitScale']) + profiles['base']
+        xy = np.column_stack((xs, profiles['coords']))
+        return np.split(xy, profiles['segmentOffsets'][1:-1])
+
+    def refLines(self):
+        """
+        Reference lines of profile segments, the same for all fields
+        """
+        profiles = self.fieldProfiles(self.field)
+        lines, coords, offsets = profiles['lines'], profiles['coords'], profiles['segmentOffsets']
+        return [[(lines[l], coords[s]), (lines[l], coords[e - 1])]
+                for s, e, l in zip(offsets[:-1], offsets[1:], profiles['segmentLines'])]
+
+    def show(self):
+        """
+        Builds the figure with controls and enters matplotlib main loop
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import Slider, RadioButtons
+
+        self.fig = plt.figure()
+        self.ax = self.fig.add_axes([0.08, 0.25, 0.72, 0.7])
+        if self.outline:
+            plotGeometry(None, 0, 1, outline=self.outline)
+        refLines = self.refLines() if self.pltDescription['refline'] else []
+        self.artist = drawProfiles(self.segments(), refLines, self.pltDescription)
+        finishAxes(self.axesConfig, self.pltDescription)
+        # keep equal aspect by resizing axes box, so that sampling range is always honored
+        self.ax.set_aspect('equal', adjustable='box')
+        self.ax.set_ylim(self.ymin, self.ymax)
+        if self.artist is not None:
+            # drawn only with blitting, on top of saved background
+            self.artist.set_animated(True)
+
+        lo, hi = self.coordRange
+        self.scaleSlider = Slider(self.fig.add_axes([0.15, 0.13, 0.6, 0.03]), 'scale', 0.05, 10.,
+                                  valinit=self.scale, valfmt='%.2f')
+        self.yminSlider = Slider(self.fig.add_axes([0.15, 0.08, 0.6, 0.03]), 'ymin', lo, hi, valinit=self.ymin)
+        self.ymaxSlider = Slider(self.fig.add_axes([0.15, 0.03, 0.6, 0.03]), 'ymax', lo, hi, valinit=self.ymax)
+        self.controls = [self.scaleSlider]
+        for slider in self.controls:
+            # redrawn with blitting as well
+            slider.drawon = False
+        self.scaleSlider.on_changed(self.setScale)
+        self.yminSlider.on_changed(lambda v: self.setRange(v, self.ymax))
+        self.ymaxSlider.on_changed(lambda v: self.setRange(self.ymin, v))
+
+        if len(self.fields) > 1:
+            self.fieldButtons = RadioButtons(self.fig.add_axes([0.82, 0.25, 0.16, 0.05 * len(self.fields) + 0.05]),
+                                             self.fields)
+            self.fieldButtons.on_clicked(self.setField)
+
+        self.fig.canvas.mpl_connect('draw_event', self.onDraw)
+        self.fig.canvas.mpl_connect('key_press_event', self.onKey)
+        showPlot()
+
+    def onDraw(self, event):
+        # full redraw (resize, range change): save background without profiles and draw them on top of it
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        if self.artist is not None:
+            self.ax.draw_artist(self.artist)
+
+    def redraw(self):
+        """
+        Replaces profiles data of the artist and blits it over the saved background
+        """
+        from matplotlib.collections import LineCollection
+
+        if self.artist is None:
+            return
+        with stage('update'):
+            segments = self.segments()
+            if isinstance(self.artist, LineCollection):
+                self.artist.set_segments(segments)
+            else:
+                xy = joinSegments(segments)
+                self.artist.set_data(xy[:, 0], xy[:, 1])
+
+            canvas = self.fig.canvas
+            if self.background is None:
+                canvas.draw_idle()
+                return
+            canvas.restore_region(self.background)
+            self.ax.draw_artist(self.artist)
+            for control in self.controls:
+                self.fig.draw_artist(control.ax)
+            canvas.blit(self.fig.bbox)
+            canvas.flush_events()
+
+    def setScale(self, scale):
+        self.scale = scale
+        self.redraw()
 
-    # mng = plt.get_current_fig_manager()
-    #
+    def setField(self, field):
+        self.field = field
+        self.redraw()
+
+    def setRange(self, ymin, ymax):
+        """
+        Changes sampling range, as it changes axes limits the whole figure is redrawn
+        """
+        if ymin >= ymax:
+            return
+        self.ymin, self.ymax = ymin, ymax
+        with stage('update'):
+            self.ax.set_ylim(ymin, ymax)
+            self.fig.canvas.draw_idle()
+
+    def onKey(self, event):
+        step = 0.1 * (self.ymax - self.ymin)
+        if event.key in ('+', '='):
+            self.scaleSlider.set_val(min(self.scale * 1.25, self.scaleSlider.valmax))
+        elif event.key == '-':
+            self.scaleSlider.set_val(max(self.scale / 1.25, self.scaleSlider.valmin))
+        elif event.key in ('n', 'p') and len(self.fields) > 1:
+            shift = 1 if event.key == 'n' else -1
+            self.fieldButtons.set_active((self.fields.index(self.field) + shift) % len(self.fields))
+        elif event.key in ('up', 'down'):
+            lo, hi = self.coordRange
+            shift = step if event.key == 'up' else -step
+            shift = min(shift, hi - self.ymax) if shift > 0 else max(shift, lo - self.ymin)
+            self.ymaxSlider.set_val(self.ymax + shift)
+            self.yminSlider.set_val(self.ymin + shift)
+        elif event.key == 'r':
+            self.scaleSlider.set_val(self.axesConfig['scale'])
+            self.yminSlider.set_val(self.coordRange[0])
+            self.ymaxSlider.set_val(self.coordRange[1])
+
+
+def showPlot():
+    import matplotlib.pyplot as plt
     try:
         mng = plt.get_current_fig_manager()
         mng.resize(*mng.window.maxsize())
     except:
-        print "Can't toggle window maximze"
+        print("Can't toggle window maximze")
+    plt.show()
 
-    return totalScale
+
+def saveFig(out):
+    import matplotlib.pyplot as plt
+    plt.savefig(out)
+
+
+def loadProfileData(args, path, fields):
+    """
+    Loads columns needed to plot given fields, according to command line options
+    :return: tuple (data, fieldRanges, lineSpacing), in streaming mode fieldRanges holds (min, max) of the fields and
+             lineSpacing distance of the first two lines for autoscaling (see ProfileWindow), otherwise they are empty
+             dictionary and None
+    """
+    import numpy as np
+
+    dtype = np.float32 if args.float32 else float
+    if args.probes:
+        columns = list(fields) + ["Points:0", "Points:1", "Points:2"]
+    else:
+        columns = list(fields) + ["Points:{}".format(args.x), "Points:{}".format(args.y)]
+
+    window = None
+    if args.chunk_size and not args.probes:
+        # clustering needs all points, so spacing coordinates are not rounded in chunks when it is used
+        precision = args.precision if args.tolerance is None else None
+        window = ProfileWindow(args.x, args.y, precision, args.ymin, args.ymax, fields)
+
+    with stage('parsing'):
+        data = loadAnyData(path, args.cache, columns, dtype, args.chunk_size, window, args.set_axis)
+    if window is None:
+        return data, dict(), None
+    return data, window.fieldRanges, window.lineSpacing
+
+
+def plotSettings(args):
+    """
+    Line description and axes configuration (see plot) according to command line options
+    :return: tuple (pltDescription, axesConfig)
+    """
+    pltSetup = {'type': args.type, 'marker': args.marker, 'linewidth': args.linewidth, 'grid':args.grid, 'labels': args.labels, 'refline': True}
+    axesConfig = {'ymax':args.ymax, 'ymin':args.ymin, 'scale':args.scale, 'xmin':args.xmin, 'xmax':args.xmax}
+    return pltSetup, axesConfig
+
+
+# inputs shared by all images rendered by the process, see renderOverlays
+overlayCache = dict()
+
+
+def renderOverlays(args, fields):
+    """
+    Loads inputs drawn in every image besides the profiles: probe segments, reference geometry outline and extra data
+    of the fields, according to command line options. They are loaded once per process and reused by all files,
+    fields and frames it renders (including batch and animation workers)
+    :return: dictionary with "probes", "outline" and "extra" keys, None for options which are not set
+    """
+    import numpy as np
+
+    key = (repr(sorted(vars(args).items())), tuple(fields))
+    if key not in overlayCache:
+        res = {'probes': None, 'outline': None, 'extra': None}
+        if args.probes:
+            res['probes'] = loadProbes(args.probes)
+        if args.geometry:
+            dtype = np.float32 if args.float32 else float
+            with stage('geometry'):
+                res['outline'] = loadGeometryOutline(args.geometry, args.x, args.y, args.concave, args.thin,
+                                                     args.cache, dtype, args.chunk_size)
+        if args.extra:
+            with stage('extra'):
+                res['extra'] = loadProfileData(args, args.extra, fields)[0]
+        overlayCache[key] = res
+    return overlayCache[key]
+
+
+def renderFigure(args, data, field, fieldRanges, index=None, lineSpacing=None, overlays=None):
+    """
+    Draws profiles of the field together with reference geometry and extra data in current axes, according to
+    command line options
+    :param index: result of renderIndex for the data, shared by all fields rendered from the same data
+    :param fieldRanges, lineSpacing: autoscaling of streamed data, see loadProfileData
+    :param overlays: result of renderOverlays, loaded for the field if not given
+    """
+    if overlays is None:
+        overlays = renderOverlays(args, [field])
+
+    pltSetup, axesConfig = plotSettings(args)
+    if args.probes:
+        probes = overlays['probes']
+        axesConfig['scale'] = plotProbes(data, args.x, args.y, field, probes, axesConfig, pltSetup, True,
+                                         fieldRanges.get(field), index, args.samples)
+    else:
+        axesConfig['scale'] = plot(data, args.x, args.y, field, args.precision, axesConfig, pltSetup, True,
+                                   fieldRanges.get(field), index, args.tolerance, args.resolution, lineSpacing)
+
+    if args.geometry:
+        with stage('geometry'):
+            plotGeometry(None, args.x, args.y, outline=overlays['outline'])
+
+    if args.extra:
+        with stage('extra'):
+            ed = overlays['extra']
+            extraSetup = {'type':' k', 'marker':'o', 'linewidth':1, 'grid':False, 'refline':False}
+            if args.probes:
+                plotProbes(ed, args.x, args.y, field, probes, axesConfig, extraSetup, False, samples=args.samples)
+            else:
+                plot(ed, args.x, args.y, field, args.precision, axesConfig, extraSetup, False,
+                     tolerance=args.tolerance, resolution=args.resolution)
 
 
-def plotGeometry(data, xdir, ydir):
+def loadProbes(path):
+    """
+    Loads probe line segments from text file, each line holds x0 y0 z0 x1 y1 z1 coordinates of segment ends
+    """
     import numpy as np
+    return np.loadtxt(path, ndmin=2).reshape(-1, 6)
+
+
+def renderIndex(args, data):
+    """
+    Computes field independent index of the data (profileIndex or probeIndex), according to command line options
+    """
+    if args.probes:
+        with stage('probing'):
+            return probeIndex(data, loadProbes(args.probes), args.samples)
+    return profileIndex(data, args.x, args.y, args.precision, args.ymin, args.ymax, tolerance=args.tolerance)
+
+
+def batchPaths(patterns):
+    """
+    Expands glob patterns into sorted list of unique file paths
+    """
+    import glob
+    return sorted(set(p for pattern in patterns for p in glob.glob(pattern)))
+
+
+def batchOutput(template, path, field):
+    """
+    Formats output file name for given input file and field
+    """
+    import os
+    name = os.path.basename(os.path.normpath(path))
+    if not os.path.isdir(path):
+        if isCompressed(name):
+            name = os.path.splitext(name)[0]
+        name = os.path.splitext(name)[0]
+    return template.format(name=name, field=field)
+
+
+def renderBatchFile(args, path, fields):
+    """
+    Batch mode task: loads the file once and saves one image for each field
+    :return: list of written images
+    """
+    import os
+    import matplotlib
+    matplotlib.use('Agg')
     import matplotlib.pyplot as plt
-    from scipy.spatial import ConvexHull
 
-    xy = np.array([data["Points:{}".format(xdir)], data["Points:{}".format(ydir)]]).T
+    data, fieldRanges, lineSpacing = loadProfileData(args, path, fields)
+    index = renderIndex(args, data)
+    shared = renderOverlays(args, fields)
+    outputs = []
+    for field in fields:
+        out = batchOutput(args.output, path, field)
+        if os.path.dirname(out) and not os.path.exists(os.path.dirname(out)):
+            try:
+                os.makedirs(os.path.dirname(out))
+            except OSError:
+                # created in the meantime by other worker
+                pass
+        plt.figure()
+        renderFigure(args, data, field, fieldRanges, index, lineSpacing, shared)
+        saveFig(out)
+        plt.close()
+        outputs.append(out)
+    return outputs
 
-    v = ConvexHull(xy).vertices
-    indices = np.zeros(len(v)+1, dtype=int)
-    indices[:-1] = v
-    indices[-1] = v[0]
-    xy = xy[indices, :]
 
-    #xy = np.array((xy))
-#    xy = sortTS(xy)
+def renderBatch(args, paths, fields, jobs=None, manifest=None):
+    """
+    Renders images of all fields for all files on a pool of worker processes
+    :param jobs: number of worker processes, by default number of CPUs
+    :param manifest: RenderManifest, if given images which are up to date are not rendered again
+    :return: list of files which failed
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
 
-    # print two_opt(xy, 1)
- #   print xy.shape
-    #plt.plot(xy[:, 0], xy[:, 1], '-k')
-    plt.fill(xy[:, 0], xy[:, 1], 'lightgray')
+    # keys are computed before rendering, so that inputs modified during the run are rendered again next time
+    keys = dict()
+    for path in paths:
+        for field in fields:
+            out = batchOutput(args.output, path, field)
+            keys[out] = renderKey(args, path, field)
 
+    skipped = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        tasks = dict()
+        for path in paths:
+            stale = [f for f in fields if manifest is None or
+                     not manifest.upToDate(batchOutput(args.output, path, f), keys[batchOutput(args.output, path, f)])]
+            skipped += len(fields) - len(stale)
+            if stale:
+                tasks[executor.submit(renderBatchFile, args, path, stale)] = path
 
+        try:
+            for task in as_completed(tasks):
+                try:
+                    for out in task.result():
+                        if manifest is not None:
+                            manifest.update(out, keys[out])
+                        print(out)
+                except Exception as e:
+                    failed.append(tasks[task])
+                    print("Failed to render {}: {}".format(tasks[task], e))
+        finally:
+            if manifest is not None:
+                manifest.save()
 
+    if skipped:
+        print("Skipped {} up to date images".format(skipped))
+    return failed
 
-def showPlot():
+
+def renderKey(args, path, field):
+    """
+    Hash of everything the image is rendered from: state of input files and effective plot settings
+    """
+    import hashlib
+    import json
+    import os
+
+    ignored = ('path', 'field', 'output', 'batch', 'jobs', 'cache', 'manifest')
+    settings = dict((k, v) for k, v in vars(args).items() if k not in ignored)
+    inputs = []
+    for p in (path, args.geometry, args.extra, args.probes):
+        if p and os.path.isdir(p):
+            inputs += [cacheKey(os.path.join(p, f)) for f in sorted(os.listdir(p))]
+        elif p:
+            inputs.append(cacheKey(p))
+    desc = json.dumps({'settings': settings, 'inputs': inputs, 'field': field}, sort_keys=True)
+    return hashlib.sha1(desc.encode('utf-8')).hexdigest()
+
+
+class RenderManifest:
+    """
+    Incremental build manifest stored as json file. It maps each written image to the key it was rendered
+    from (see renderKey) and to the state of the image file itself, so removed or overwritten images are not
+    reported as up to date
+    """
+    def __init__(self, path):
+        import json
+        import os
+
+        self.path = path
+        self.entries = dict()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                print("Can't read manifest {}, all images will be rendered".format(path))
+
+    def upToDate(self, output, key):
+        import os
+
+        entry = self.entries.get(os.path.abspath(output))
+        return entry is not None and entry['key'] == key and os.path.exists(output) and \
+            entry['output'] == cacheKey(output)
+
+    def update(self, output, key):
+        import os
+        self.entries[os.path.abspath(output)] = {'key': key, 'output': cacheKey(output)}
+
+    def save(self):
+        import json
+        import os
+
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.rename(self.path + '.tmp', self.path)
+
+
+def naturalKey(path):
+    """
+    Sort key comparing numbers in the path by value, so that time steps are ordered (1, 2, 10, not 1, 10, 2)
+    """
+    import re
+
+    parts = re.split(r'(\d+(?:\.\d+)?(?:e[-+]?\d+)?)', path)
+    return [(0, float(p), '') if i % 2 else (1, 0., p) for i, p in enumerate(parts)]
+
+
+def timeStepPaths(patterns):
+    """
+    Expands glob patterns into ordered list of time step files (or sets directories): patterns keep the given order,
+    matches of each pattern are sorted by numbers in their names
+    """
+    import glob
+
+    paths = []
+    for pattern in patterns:
+        for p in sorted(glob.glob(pattern), key=naturalKey):
+            if p not in paths:
+                paths.append(p)
+    return paths
+
+
+def frameCoordinates(args, data):
+    """
+    Point coordinates the grouping index of the frame depends on
+    """
+    dirs = (0, 1, 2) if args.probes else (args.x, args.y)
+    return [data["Points:{}".format(d)] for d in dirs]
+
+
+def renderFrames(args, frames, fields, fieldRanges, limits):
+    """
+    Animation task: renders frames sequentially, grouping index is computed again only when point coordinates differ
+    from the previous frame, otherwise only field columns are swapped
+    :param frames: list of (path, output image) tuples
+    :param fieldRanges: fixed (min, max) of each field, so that profiles scale does not change between frames
+    :param limits: fixed (xlim, ylim) of each panel
+    :return: tuple (written images, number of frames which reused the index)
+    """
+    import os
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
     import matplotlib.pyplot as plt
-    plt.show()
 
+    coords = index = None
+    reused = 0
+    outputs = []
+    shared = renderOverlays(args, fields)
+    for path, out in frames:
+        data, _, lineSpacing = loadProfileData(args, path, fields)
+        frameCoords = frameCoordinates(args, data)
+        if coords is not None and all(np.array_equal(a, b) for a, b in zip(coords, frameCoords)):
+            reused += 1
+        else:
+            coords, index = frameCoords, renderIndex(args, data)
 
-def saveFig(out):
+        plt.figure()
+        for i, field in enumerate(fields):
+            ax = plt.subplot(1, len(fields), i + 1)
+            if len(fields) > 1:
+                plt.title(field)
+            renderFigure(args, data, field, fieldRanges, index, lineSpacing, shared)
+            ax.set_aspect('equal', adjustable='box')
+            ax.set_xlim(limits[i][0])
+            ax.set_ylim(limits[i][1])
+        plt.suptitle(batchOutput('{name}', path, None))
+
+        # written under temporary name first, so that interrupted frame is not taken as rendered on resume
+        tmp = out + '.tmp.png'
+        saveFig(tmp)
+        plt.close()
+        os.rename(tmp, out)
+        outputs.append(out)
+    return outputs, reused
+
+
+def animationLayout(args, path, fields):
+    """
+    Renders the first frame to find fixed field ranges and axes limits used by all frames
+    :return: tuple (fieldRanges, limits), see renderFrames
+    """
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
     import matplotlib.pyplot as plt
-    plt.savefig(out)
+
+    data, fieldRanges, lineSpacing = loadProfileData(args, path, fields)
+    for field in fields:
+        if field not in fieldRanges:
+            fieldRanges[field] = (float(np.min(data[field])), float(np.max(data[field])))
+
+    index = renderIndex(args, data)
+    shared = renderOverlays(args, fields)
+    limits = []
+    plt.figure()
+    for i, field in enumerate(fields):
+        ax = plt.subplot(1, len(fields), i + 1)
+        renderFigure(args, data, field, fieldRanges, index, lineSpacing, shared)
+        ax.figure.canvas.draw()
+        limits.append((ax.get_xlim(), ax.get_ylim()))
+    plt.close()
+    return fieldRanges, limits
+
+
+def assembleAnimation(frames, output, fps=10):
+    """
+    Joins frame images into animation: gif with Pillow, any other format (mp4, avi, webm, ...) with ffmpeg
+    """
+    import os
+    import subprocess
+
+    if output.lower().endswith('.gif'):
+        from PIL import Image
+
+        def loadFrames(paths):
+            # one frame file open at a time, thousands of frames would exceed the limit of open files
+            for path in paths:
+                with Image.open(path) as image:
+                    image.load()
+                    yield image
+
+        images = loadFrames(frames)
+        next(images).save(output, save_all=True, append_images=images, duration=int(1000. / fps), loop=0)
+        return
+
+    # explicit list of frames, so that ffmpeg gets exactly this sequence even if stale frames of longer runs exist
+    listFile = output + '.frames.txt'
+    with open(listFile, 'w') as f:
+        for frame in frames:
+            f.write("file '{}'\nduration {}\n".format(os.path.abspath(frame).replace("'", "'\\''"), 1. / fps))
+    try:
+        subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', listFile,
+                               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', '-r', str(fps), output])
+    except OSError:
+        raise Exception("ffmpeg is required to write {}, install it or use *.gif output".format(output))
+    finally:
+        os.remove(listFile)
+
+
+def renderAnimation(args, paths, fields, output, framesDir=None, fps=10, jobs=None, resume=False):
+    """
+    Renders one frame per time step file on a pool of worker processes and assembles them into animation. Each worker
+    gets a contiguous run of frames, so the grouping index is reused as long as point coordinates do not change.
+    Profiles scale and axes limits are taken from the first time step
+    :param framesDir: directory for frame images, by default next to the output
+    :param resume: frames already present in framesDir are not rendered again
+    :return: list of time step files which failed (or the output if frames could not be assembled)
+    """
+    import os
+    import math
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    framesDir = framesDir or os.path.splitext(output)[0] + '_frames'
+    if not os.path.exists(framesDir):
+        os.makedirs(framesDir)
+
+    frames = [(p, os.path.join(framesDir, 'frame_{:05d}.png'.format(i))) for i, p in enumerate(paths)]
+    todo = [f for f in frames if not (resume and os.path.exists(f[1]))]
+    if len(todo) < len(frames):
+        print("Resuming, {} of {} frames already rendered".format(len(frames) - len(todo), len(frames)))
+
+    failed = []
+    if todo:
+        fieldRanges, limits = animationLayout(args, paths[0], fields)
+        jobs = jobs or multiprocessing.cpu_count()
+        size = int(math.ceil(len(todo) / float(jobs)))
+        reused = 0
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            tasks = dict((executor.submit(renderFrames, args, todo[i:i + size], fields, fieldRanges, limits),
+                          todo[i:i + size]) for i in range(0, len(todo), size))
+            for task in as_completed(tasks):
+                try:
+                    outputs, r = task.result()
+                    reused += r
+                    print("Rendered {} frames".format(len(outputs)))
+                except Exception as e:
+                    failed += [p for p, _ in tasks[task]]
+                    print("Failed to render frames of {}: {}".format(', '.join(p for p, _ in tasks[task]), e))
+        print("Grouping index reused for {} of {} frames".format(reused, len(todo)))
+
+    if failed:
+        print("Animation not assembled, rerun with --resume to render missing frames")
+        return failed
+
+    try:
+        assembleAnimation([f for _, f in frames], output, fps)
+    except Exception as e:
+        print("Can't assemble animation: {}. Frames are kept in {}".format(e, framesDir))
+        return [output]
+    print(output)
+    return failed
+
+
+def renderFile(args, fields):
+    """
+    Single file mode: loads the file, draws profiles of all fields in current figure and saves it if output is given
+    """
+    d, fieldRanges, lineSpacing = loadProfileData(args, args.path, fields)
+    shared = renderOverlays(args, fields)
+    if len(fields) > 1:
+        # one panel per field, all sharing the same grouping of points
+        import matplotlib.pyplot as plt
+
+        with stage('index'):
+            index = renderIndex(args, d)
+        for i, field in enumerate(fields):
+            plt.subplot(1, len(fields), i + 1)
+            plt.title(field)
+            renderFigure(args, d, field, fieldRanges, index, lineSpacing, shared)
+    else:
+        renderFigure(args, d, args.field, fieldRanges, lineSpacing=lineSpacing, overlays=shared)
+
+    if args.output:
+        with stage('saving'):
+            saveFig(args.output)
+
+
+def viewFile(args, fields):
+    """
+    Interactive mode: loads the file and opens ProfileViewer of the fields
+    """
+    import numpy as np
+
+    data, fieldRanges, lineSpacing = loadProfileData(args, args.path, fields)
+    outline = None
+    if args.geometry:
+        dtype = np.float32 if args.float32 else float
+        with stage('geometry'):
+            outline = loadGeometryOutline(args.geometry, args.x, args.y, args.concave, args.thin, args.cache, dtype,
+                                          args.chunk_size)
+
+    pltSetup, axesConfig = plotSettings(args)
+    viewer = ProfileViewer(data, args.x, args.y, fields, args.precision, axesConfig, pltSetup, fieldRanges,
+                           args.tolerance, args.resolution, outline, lineSpacing)
+    viewer.show()
+    return viewer
+
+
+def toleranceArg(value):
+    """
+    Parses --tolerance command line option
+    """
+    return value if value == 'auto' else float(value)
 
 
 if __name__ == "__main__":
     import argparse
 
+    try:
+        import matplotlib
+    except:
+        print('The "matplotlib" required to plot profiles. Install this python package before usage')
+        exit()
+
     parser = argparse.ArgumentParser(description='Plots multiple profiles of given field along defined direction. '
                                                  'As input accepts ParaView csv output of File/Save Data')
-    parser.add_argument("path", type=str,
-                        help='Path to *.csv file')
+    parser.add_argument("path", type=str, nargs='+',
+                        help='Path to *.csv file (also gzip or xz compressed *.csv.gz, *.csv.xz), XML VTK file '
+                             '(*.vtp, *.vtu) or OpenFOAM sample sets (postProcessing/<sets>/<time> directory or single '
+                             '*.xy file). Glob patterns in --batch mode')
     parser.add_argument("field", type=str,
-                        help='Choose what field should be plotted. Available fields according to *.csv file header')
+                        help='Choose what field should be plotted. Available fields according to *.csv file header. '
+                             'Comma separated list of fields plots each field in separate panel (separate file '
+                             'in --batch mode)')
     parser.add_argument("x", type=int, choices=[0, 1, 2],
                         help='Specify profiles spacing direction (direction along which subsequent sampling lines lie')
     parser.add_argument("y", type=int, choices=[0, 1, 2],
@@ -211,6 +2146,11 @@ if __name__ == "__main__":
                              "algorithm, might fail to group points in single sampling line. To high value (if damin "
                              "is very small) might group multiple lines")
 
+    parser.add_argument("--tolerance", type=toleranceArg,
+                        help='Detect sampling lines by clustering spacing coordinates instead of rounding them to '
+                             '--precision: points belong to the same line as long as gaps between their sorted spacing '
+                             'coordinates do not exceed this tolerance. Use "auto" to estimate it from the gaps')
+
     parser.add_argument("-t", "--type", type=str, default="-b",
                         help='''Matplotlib line type, default "-k" is black continuous line, ".k" is black dots,
                              " k"(space + k) is no line, see more
@@ -233,6 +2173,11 @@ if __name__ == "__main__":
     parser.add_argument("-e", "--extra", type=str,
                         help="Specify additial file to add to the plot. For this data line properties are fixed, must use the same columns naming as original file, and the same dirs for spacing and line")
 
+    parser.add_argument("-r", "--resolution", type=int,
+                        help="Decimate long profiles before drawing: each profile segment is divided into given number "
+                             "of bins (e.g. figure height in pixels) and only first, last, minimal and maximal value of "
+                             "each bin is drawn. Keeps peaks while bounding render time and output size")
+
     parser.add_argument("-g", "--grid", action="store_true",
                         help="Adds grid to plot")
 
@@ -244,23 +2189,148 @@ if __name__ == "__main__":
 
     parser.add_argument('--geometry', type=str, help="Show reference geometry")
 
+    parser.add_argument("--concave", type=float,
+                        help="Draw concave outline of reference geometry instead of convex hull: Delaunay triangles "
+                             "with circumradius larger than given value are removed (alpha shape)")
+
+    parser.add_argument("--thin", type=float,
+                        help="Pre-thin reference geometry points on grid with given cell size before computing outline")
+
+    parser.add_argument("--set-axis", type=str, default='xyz', choices=sorted(SET_AXES),
+                        help='"axis" entry of OpenFOAM sets dictionary, needed to read set files written without '
+                             'header. Only "xyz" provides all point coordinates')
+
+    parser.add_argument("--probes", type=str,
+                        help="Sample the field along arbitrary line segments instead of grouping points into axis "
+                             "aligned lines. Path to text file where each line holds x0 y0 z0 x1 y1 z1 coordinates of "
+                             "segment ends. Values are interpolated from the nearest points (requires scipy)")
+
+    parser.add_argument("--samples", type=int, default=100,
+                        help="Number of samples along each probe segment")
+
+    parser.add_argument("-c", "--cache", action="store_true",
+                        help="Store parsed csv files in binary sidecar files (*.cache.npy) next to them. Subsequent runs"
+                             " on unchanged files load the sidecar instead of parsing the text. Reference geometry "
+                             "outline is cached as well (*.outline.json)")
+
+    parser.add_argument("--chunk-size", type=int,
+                        help="Stream csv files in chunks of given number of rows, keeping only points inside "
+                             "--ymin/--ymax range. Use for files which do not fit in memory")
+
+    parser.add_argument("--float32", action="store_true",
+                        help="Load data in single precision, halves memory usage for very large files")
+
+    parser.add_argument("--batch", action="store_true",
+                        help="Batch mode: path is a glob pattern (more patterns may be given), field may be comma "
+                             "separated list of fields and output is a file name template with {name} (csv file name "
+                             "without extension) and {field} placeholders, e.g. img/{name}_{field}.png. One image "
+                             "is written for each file and field, each file is parsed once")
+
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Number of worker processes used in batch and animation modes, by default number of "
+                             "CPUs")
+
+    parser.add_argument("--manifest", type=str,
+                        help="Incremental rendering: path to manifest file recording inputs and settings of each written "
+                             "image. Images whose input files and settings did not change since are not rendered again")
+
+    parser.add_argument("-i", "--interactive", action="store_true",
+                        help="Open interactive viewer: scale, sampling range and field (comma separated list) are "
+                             "tuned with sliders and keys (+/- scale, n/p field, up/down range, r reset) without "
+                             "reloading the data")
+
+    parser.add_argument("--animate", type=str,
+                        help="Animation mode: path is ordered list of time step files (glob patterns are sorted by "
+                             "numbers in file names), one frame is rendered for each and frames are joined into given "
+                             "animation file (*.gif, or video like *.mp4 which requires ffmpeg). Profiles scale and "
+                             "axes limits are taken from the first time step")
+
+    parser.add_argument("--frames", type=str,
+                        help="Directory for animation frames, by default <animation name>_frames")
+
+    parser.add_argument("--fps", type=float, default=10, help="Animation frames per second")
+
+    parser.add_argument("--resume", action="store_true",
+                        help="Resume partially rendered animation: frames already present are not rendered again")
+
+    parser.add_argument("--profile", action="store_true",
+                        help="Report wall time and peak memory of pipeline stages (parsing, rounding, grouping, "
+                             "segmenting, hull, drawing, saving) after plotting. Not available in --batch mode")
+
+    parser.add_argument("--profile-output", type=str,
+                        help="Dump cProfile statistics of the run to given file (readable with pstats or snakeviz), "
+                             "implies --profile")
+
     args = parser.parse_args()
 
-    d = loadData(args.path)
-    pltSetup = {'type': args.type, 'marker': args.marker, 'linewidth': args.linewidth, 'grid':args.grid, 'labels': args.labels, 'refline': True}
-    axesConfig = {'ymax':args.ymax, 'ymin':args.ymin, 'scale':args.scale, 'xmin':args.xmin, 'xmax':args.xmax}
-    axesConfig['scale'] = plot(d, args.x, args.y, args.field, args.precision, axesConfig, pltSetup, True)
+    fields = args.field.split(',')
 
-    if args.geometry:
-        geom = loadData(args.geometry)
-        plotGeometry(geom, args.x, args.y)
+    if args.interactive and (args.batch or args.output or args.probes or args.extra):
+        parser.error("--interactive can't be combined with --batch, --output, --probes or --extra")
 
-    if args.extra:
-        ed = loadData(args.extra)
-        plot(ed, args.x, args.y, args.field, args.precision, axesConfig, {'type':' k', 'marker':'o', 'linewidth':1, 'grid':False, 'refline':False}, False)
+    if args.animate and (args.batch or args.interactive):
+        parser.error("--animate can't be combined with --batch or --interactive")
+
+    if args.profile or args.profile_output:
+        if args.batch or args.animate:
+            parser.error("--profile is not supported in batch and animation modes, profile a single file instead")
+        toolsPath()
+        from tools.timing import StageTimer, profiled
+
+        stageTimer = StageTimer()
+
+    if args.batch:
+        if not args.output or '{name}' not in args.output:
+            parser.error("batch mode requires --output template containing {name} placeholder")
+        if len(fields) > 1 and '{field}' not in args.output:
+            parser.error("batch mode with several fields requires --output template containing {field} placeholder")
+
+        paths = batchPaths(args.path)
+        if not paths:
+            parser.error("no files match {}".format(', '.join(args.path)))
+
+        manifest = RenderManifest(args.manifest) if args.manifest else None
+        failed = renderBatch(args, paths, fields, args.jobs, manifest)
+        exit(1 if failed else 0)
+
+    if args.animate:
+        paths = timeStepPaths(args.path)
+        if not paths:
+            parser.error("no files match {}".format(', '.join(args.path)))
+
+        failed = renderAnimation(args, paths, fields, args.animate, args.frames, args.fps, args.jobs, args.resume)
+        exit(1 if failed else 0)
+
+    if len(args.path) > 1:
+        parser.error("several files can be plotted only in --batch or --animate mode")
+    args.path = args.path[0]
+
+    manifest = RenderManifest(args.manifest) if args.manifest and args.output else None
+    if manifest is not None and manifest.upToDate(args.output, renderKey(args, args.path, args.field)):
+        print("{} is up to date".format(args.output))
+        exit(0)
+
+    if args.output:
+        # headless rendering, no window manager is needed to save the image
+        matplotlib.use('Agg')
+
+    run = viewFile if args.interactive else renderFile
+    if args.profile_output:
+        with profiled(args.profile_output):
+            run(args, fields)
+    else:
+        run(args, fields)
+
+    if stageTimer is not None:
+        stageTimer.report()
+        stageTimer.stop()
 
+    if args.interactive:
+        exit(0)
 
     if args.output:
-        saveFig(args.output)
+        if manifest is not None:
+            manifest.update(args.output, renderKey(args, args.path, args.field))
+            manifest.save()
     else:
         showPlot()
@@ -26,3 +26,65 @@ def spread(seq, num):
         yield seq[i]
 
 
+def spread_id_array(seq, num):
+    """
+    the same indices as spread_id, computed at once as numpy
+    integer array
+    seq may be sequence or its length
+    eg:
+    spread_id_array(np.linspace(0,1,100), 10) -> array([0, 10, 20, ...])
+    """
+    import numpy as np
+
+    length = float(len(seq) if hasattr(seq, '__len__') else seq)
+    return np.ceil(np.arange(num) * length / num).astype(np.intp)
+
+
+def spread_array(seq, num):
+    """
+    the same elements as spread, numpy arrays are indexed at
+    once: slice view if length is multiple of num, single
+    gather (copy) otherwise. Other sequences give list.
+    Empty sequence gives empty result
+    eg:
+    a = np.linspace(0,1,100)
+    spread_array(a, 10) -> view of a[::10]
+    """
+    import numpy as np
+
+    if not len(seq):
+        return seq[:0] if isinstance(seq, np.ndarray) else []
+    if isinstance(seq, np.ndarray):
+        length = len(seq)
+        if num and length % num == 0:
+            return seq[::length // num]
+        return seq[spread_id_array(length, num)]
+    return [seq[i] for i in spread_id_array(seq, num)]
+
+
+def spread_stream(iterable, num):
+    """
+    list of num equally distributed elements of iterable of
+    unknown length (generator, lines of a file), read in
+    single pass. At most 2*num elements are kept: every
+    stride-th element is stored and when the buffer is full,
+    every second one is dropped and the stride doubled.
+    Elements are spread as evenly as the final stride allows,
+    the first element is always included
+    eg:
+    spread_stream(open('log.simpleFoam'), 100)
+    """
+    if num <= 0:
+        return []
+    kept = []
+    stride = 1
+    for i, item in enumerate(iterable):
+        if i % stride:
+            continue
+        kept.append(item)
+        if len(kept) == 2 * num:
+            kept = kept[::2]
+            stride *= 2
+    if len(kept) <= num:
+        return kept
+    return [kept[i] for i in spread_id_array(kept, num)]
@@ -1,34 +1,722 @@
+import io
 import os
+import mmap
+
+
+def rlines(filename, encoding=None, errors='strict', view=False, block_size=1 << 20):
+    """
+    a generator that returns the lines of a file in reverse order. File is memory
+    mapped and processed backwards in blocks aligned to line breaks with rfind,
+    each block is split in one call. Line endings (\\n or \\r\\n) are stripped,
+    empty lines are returned
+    parameters:
+      - encoding(string): decode lines to text (encoding has to be ascii compatible,
+                          e.g. utf-8 or latin-1), by default bytes are returned
+      - view(boolean): return zero-copy memoryview slices of the mapping instead of
+                       bytes, line by line with rfind. Slower for short lines but
+                       nothing is copied. Views are valid only until the generator
+                       is exhausted or closed
+      - block_size(int): size of the block split at once
+    gzip and xz files (*.gz, *.xz) are read through copen
+    example:
+     for line in rlines('log.simpleFoam'):
+         if line.startswith(b'Time = '):
+             break
+    """
+    if _compressed(filename):
+        # no mapping, blocks are read backwards through the checkpoint index
+        with copen(filename) as fh:
+            for block in _rblocks(fh, block_size, block_size):
+                for line in reversed(_lines(block, encoding, errors)):
+                    yield line
+        return
+
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        end = len(mm)
+        # line break at the end of file terminates the last line, it does not start a new one
+        if mm[end - 1:end] == b'\n':
+            end -= 1
+
+        if view:
+            for line in _rviews(mm, end):
+                yield line.tobytes().decode(encoding, errors) if encoding else line
+            return
+
+        nl, cr = (u'\n', u'\r') if encoding else (b'\n', b'\r')
+        while end >= 0:
+            # block starts right after line break, so that it contains only complete lines
+            start = mm.rfind(b'\n', 0, end - block_size) + 1 if end > block_size else 0
+            block = mm[start:end]
+            if encoding:
+                block = block.decode(encoding, errors)
+            lines = block.split(nl)
+            if cr in block:
+                lines = [l[:-1] if l.endswith(cr) else l for l in lines]
+            lines.reverse()
+            for line in lines:
+                yield line
+            end = start - 1
+    finally:
+        try:
+            mm.close()
+        except BufferError:
+            # views are still referenced by the caller, mapping is closed when they are gone
+            pass
+
+
+def _rviews(mm, end):
+    """memoryview slices of the mapping between line breaks, from end backwards"""
+    buf = memoryview(mm)
+    cr = b'\r'[0]
+    try:
+        while end >= 0:
+            start = mm.rfind(b'\n', 0, end) + 1
+            stop = end - 1 if end > start and mm[end - 1] == cr else end
+            yield buf[start:stop]
+            end = start - 1
+    finally:
+        buf.release()
+
 
 def ropen(filename, buf_size=8192):
-    """a generator that returns the lines of a file in reverse order"""
-    with open(filename) as fh:
-        segment = None
-        offset = 0
-        file_size = fh.seek(0, os.SEEK_END)
-        total_size = remaining_size = fh.tell()
-        while remaining_size > 0:
-            offset = min(total_size, offset + buf_size)
-            #fh.seek(file_size - offset)
-            fh.seek(-offset, os.SEEK_END)
-            buffer = fh.read(min(remaining_size, buf_size))
-            remaining_size -= buf_size
-            lines = buffer.split('\n')
-            # the first line of the buffer is probably not a complete line so
-            # we'll save it and append it to the last line of the next buffer
-            # we read
-            if segment is not None:
-                # if the previous chunk starts right from the beginning of line
-                # do not concact the segment to the last line of new chunk
-                # instead, yield the segment first
-                if buffer[-1] is not '\n':
-                    lines[-1] += segment
-                else:
-                    yield segment
-            segment = lines[0]
-            for index in range(len(lines) - 1, 0, -1):
-                if len(lines[index]):
-                    yield lines[index]
-        # Don't yield None if the file was empty
-        if segment is not None:
-            yield segment
\ No newline at end of file
+    """
+    a generator that returns the lines of a file in reverse order, see rlines
+    (buf_size is not used anymore, file is memory mapped)
+    """
+    import locale
+    encoding = locale.getpreferredencoding(False) if str is not bytes else None
+    for line in rlines(filename, encoding):
+        yield line
+
+
+def _rblocks(fh, block_size=4096, max_block_size=1 << 24):
+    """
+    a generator that reads binary file object backwards in blocks growing twice
+    each step (up to max_block_size). Blocks consist of complete lines only: part
+    of a line cut by the block start is carried over to the next block
+    """
+    fh.seek(0, os.SEEK_END)
+    end = fh.tell()
+    partial = b''
+    while end > 0:
+        start = max(0, end - block_size)
+        fh.seek(start)
+        data = fh.read(end - start) + partial
+        end = start
+        block_size = min(2 * block_size, max_block_size)
+        partial = b''
+        if start > 0:
+            cut = data.find(b'\n') + 1
+            if cut == 0:
+                # single line longer than the block
+                partial = data
+                continue
+            partial, data = data[:cut], data[cut:]
+        yield data
+    if partial:
+        yield partial
+
+
+def _lines(data, encoding=None, errors='strict'):
+    """splits block of complete lines, line endings (\\n or \\r\\n) are stripped"""
+    lines = data.split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()
+    lines = [l[:-1] if l.endswith(b'\r') else l for l in lines]
+    return [l.decode(encoding, errors) for l in lines] if encoding else lines
+
+
+def _binary(path):
+    """opens file path (see copen), file objects are returned unchanged and not closed"""
+    import contextlib
+    if hasattr(path, 'read'):
+        return contextlib.contextmanager(lambda: (yield path))()
+    return copen(path)
+
+
+def tail(path, n=10, encoding=None, errors='strict'):
+    """
+    returns list of last n lines of the file (oldest first). File is read
+    backwards in growing blocks until n complete lines are found, so the cost
+    depends on the size of the answer, not the size of the file
+    parameters:
+      - path: file path or binary file object supporting seek
+      - encoding(string): decode lines to text, by default bytes are returned
+    example:
+     print tail('log.simpleFoam', 20)
+    """
+    if n <= 0:
+        return []
+    data = b''
+    with _binary(path) as fh:
+        for block in _rblocks(fh):
+            data = block + data
+            if data.count(b'\n') > n:
+                break
+    return _lines(data, encoding, errors)[-n:]
+
+
+def rfind_line(path, pattern, encoding=None, errors='strict'):
+    """
+    returns the last line of the file matching the regular expression, None if
+    there is none. File is read backwards in growing blocks and each block is
+    scanned with compiled bytes regex at once, reading stops at the first block
+    with a match. Pattern is searched in MULTILINE mode (^ and $ match at line
+    boundaries), the whole line containing start of the last match is returned
+    parameters:
+      - path: file path or binary file object supporting seek
+      - pattern: regular expression, string, bytes or compiled
+      - encoding(string): decode the line to text, by default bytes are returned,
+                          also used to encode text pattern (utf-8 if not given)
+    example:
+     rfind_line('log.simpleFoam', r'^Time = ')  <-- b'Time = 1250'
+    """
+    import re
+
+    flags = re.MULTILINE
+    if hasattr(pattern, 'pattern'):
+        flags |= pattern.flags & (re.IGNORECASE | re.DOTALL | re.VERBOSE)
+        pattern = pattern.pattern
+    if not isinstance(pattern, bytes):
+        pattern = pattern.encode(encoding or 'utf-8')
+    regex = re.compile(pattern, flags)
+
+    with _binary(path) as fh:
+        for block in _rblocks(fh):
+            match = None
+            for match in regex.finditer(block):
+                pass
+            if match is not None:
+                start = block.rfind(b'\n', 0, match.start()) + 1
+                end = block.find(b'\n', match.start())
+                return _lines(block[start:end if end >= 0 else len(block)], encoding, errors)[0]
+    return None
+
+
+
+# Random access to compressed files
+#
+# gzip: checkpoint index is built in one pass over the file, like zlib's zran
+# example does. At deflate block boundaries, every `spacing` bytes of output,
+# position in compressed stream and 32 kB window of preceding output are
+# stored, so decompression can restart from the nearest checkpoint. Needed
+# zlib calls (inflate with Z_BLOCK, inflatePrime) are not exposed by python
+# zlib module, system zlib library is used through ctypes. Index is cached
+# next to the file (*.gzidx).
+# xz: files compressed in blocks (xz -T, --block-size) carry index of blocks at
+# the end of the file, each block can be decoded on its own with raw decoder.
+
+COMPRESSED_EXTENSIONS = ('.gz', '.xz')
+
+_WINDOW = 32768
+_CHUNK = 1 << 16
+_LIBZ = []
+
+
+def _libz():
+    """system zlib library loaded with ctypes, None if not available"""
+    import ctypes
+    import ctypes.util
+
+    if not _LIBZ:
+        lib = None
+        name = ctypes.util.find_library('z') or ctypes.util.find_library('zlib1')
+        try:
+            lib = ctypes.CDLL(name) if name else None
+            if lib is not None:
+                lib.zlibVersion.restype = ctypes.c_char_p
+                lib.inflatePrime, lib.inflateReset2
+        except (OSError, AttributeError):
+            lib = None
+        _LIBZ.append(lib)
+    return _LIBZ[0]
+
+
+def _byte(data):
+    """first byte of bytes as int, python 2 and 3"""
+    return bytearray(data[:1])[0]
+
+
+class _Inflater(object):
+    """
+    inflate stream of system zlib reading compressed data from file object at its
+    current position, handles concatenated gzip members
+    parameters:
+      - raw(boolean): raw deflate data (restart from checkpoint), gzip member otherwise
+    """
+    Z_OK, Z_STREAM_END, Z_NEED_DICT, Z_BUF_ERROR, Z_BLOCK = 0, 1, 2, -5, 5
+
+    def __init__(self, fh, raw=False):
+        import ctypes
+
+        class ZStream(ctypes.Structure):
+            _fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+                        ('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+                        ('msg', ctypes.c_char_p), ('state', ctypes.c_void_p),
+                        ('zalloc', ctypes.c_void_p), ('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p),
+                        ('data_type', ctypes.c_int), ('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+        self.lib = _libz()
+        self.fh = fh
+        self.raw = raw
+        self.eof = False
+        self.strm = ZStream()
+        self.input = ctypes.create_string_buffer(_CHUNK)
+        # 31 - gzip header, -15 - raw deflate
+        ret = self.lib.inflateInit2_(ctypes.byref(self.strm), -15 if raw else 31, self.lib.zlibVersion(),
+                                     ctypes.sizeof(self.strm))
+        if ret != self.Z_OK:
+            raise IOError("zlib inflateInit failed (%d)" % ret)
+
+    def __del__(self):
+        import ctypes
+        if getattr(self, 'strm', None) is not None:
+            self.lib.inflateEnd(ctypes.byref(self.strm))
+
+    def fill(self):
+        """reads next chunk of compressed data if input is consumed, returns False at end of file"""
+        import ctypes
+
+        if self.strm.avail_in:
+            return True
+        data = self.fh.read(_CHUNK)
+        if not data:
+            return False
+        ctypes.memmove(self.input, data, len(data))
+        self.strm.next_in = ctypes.addressof(self.input)
+        self.strm.avail_in = len(data)
+        return True
+
+    def restart(self, bits, value, window):
+        """sets bits of the byte preceding checkpoint and window of preceding output"""
+        import ctypes
+
+        if bits:
+            self.lib.inflatePrime(ctypes.byref(self.strm), bits, value >> (8 - bits))
+        self.lib.inflateSetDictionary(ctypes.byref(self.strm), window, len(window))
+
+    def next_member(self):
+        """
+        prepares the stream for the next gzip member after the end of the current
+        one, returns False if there is none
+        """
+        import ctypes
+
+        if self.raw:
+            # gzip trailer is not consumed in raw mode
+            skip = 8
+            while skip:
+                if not self.fill():
+                    return False
+                n = min(skip, self.strm.avail_in)
+                self.strm.next_in += n
+                self.strm.avail_in -= n
+                skip -= n
+            self.raw = False
+        if not self.fill():
+            return False
+        self.lib.inflateReset2(ctypes.byref(self.strm), 31)
+        return True
+
+    def inflate(self, out, offset, size, flush=0):
+        """
+        inflates at most size bytes into ctypes buffer out at offset
+        returns (number of produced bytes, zlib return code)
+        """
+        import ctypes
+
+        self.strm.next_out = ctypes.addressof(out) + offset
+        self.strm.avail_out = size
+        ret = self.lib.inflate(ctypes.byref(self.strm), flush)
+        if (ret < 0 and ret != self.Z_BUF_ERROR) or ret == self.Z_NEED_DICT:
+            raise IOError("corrupted gzip data in %s (%d)" % (getattr(self.fh, 'name', ''), ret))
+        return size - self.strm.avail_out, ret
+
+    def read(self, out, size):
+        """fills ctypes buffer out with up to size bytes of output, returns their number (0 at the end)"""
+        produced = 0
+        while produced < size and not self.eof:
+            if not self.fill():
+                self.eof = True
+                break
+            try:
+                n, ret = self.inflate(out, produced, size - produced)
+            except IOError:
+                if self.strm.total_out or self.raw:
+                    raise
+                # garbage (e.g. zero padding) after the last member
+                self.eof = True
+                break
+            produced += n
+            if ret == self.Z_STREAM_END and not self.next_member():
+                self.eof = True
+        return produced
+
+
+def _gzip_checkpoints(fh, spacing):
+    """
+    decompresses the whole gzip file once, returns its uncompressed size and list
+    of checkpoints (output offset, input offset, bits, window)
+    """
+    import ctypes
+
+    z = _Inflater(fh)
+    window = ctypes.create_string_buffer(_WINDOW)
+    points = []
+    total_in = total_out = last = 0
+    left = _WINDOW
+    while z.fill():
+        if left == 0:
+            left = _WINDOW
+        avail = z.strm.avail_in
+        try:
+            n, ret = z.inflate(window, _WINDOW - left, left, _Inflater.Z_BLOCK)
+        except IOError:
+            if z.strm.total_out or not total_out:
+                raise
+            # garbage (e.g. zero padding) after the last member, see _Inflater.read
+            break
+        total_in += avail - z.strm.avail_in
+        total_out += n
+        left -= n
+        if ret == _Inflater.Z_STREAM_END:
+            # next member header (trailer was consumed)
+            if not z.next_member():
+                break
+            continue
+        # end of deflate block (bit 7), not the last block of the member (bit 6)
+        if z.strm.data_type & 128 and not z.strm.data_type & 64 and (not points or total_out - last > spacing):
+            # window is circular, the oldest output starts at its free part
+            data = window.raw
+            start = _WINDOW - left
+            points.append((total_out, total_in, z.strm.data_type & 7, data[start:] + data[:start]))
+            last = total_out
+    return total_out, points
+
+
+class CompressedReader(io.RawIOBase):
+    """read-only seekable binary file object over compressed file, see copen"""
+    def __init__(self, path):
+        io.RawIOBase.__init__(self)
+        self.name = path
+        self.size = 0
+        self._fh = open(path, 'rb')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._pos
+        size = max(0, min(size, self.size - self._pos))
+        data = self._read_at(self._pos, size) if size else b''
+        self._pos += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._fh.close()
+        io.RawIOBase.close(self)
+
+
+class GzipReader(CompressedReader):
+    """
+    random access to gzip file through checkpoint index, see module comment
+    parameters:
+      - spacing(int): distance of checkpoints in uncompressed bytes, read
+                      starts at most that far before requested position
+      - cache(boolean): store index in *.gzidx file next to the gzip file and
+                        reuse it while the file does not change
+    """
+    MAGIC = b'GZIDX1'
+
+    def __init__(self, path, spacing=4 << 20, cache=True):
+        CompressedReader.__init__(self, path)
+        self.spacing = spacing
+        self.points = None
+        if cache:
+            self._load_index()
+        if self.points is None:
+            self._fh.seek(0)
+            self.size, self.points = _gzip_checkpoints(self._fh, spacing)
+            if cache:
+                self._save_index()
+        self._outs = [p[0] for p in self.points]
+        self._z = None
+        self._zpos = 0
+
+    def _key(self):
+        stat = os.stat(self.name)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_index(self):
+        import json
+        import struct
+        import zlib
+
+        try:
+            with open(self.name + '.gzidx', 'rb') as f:
+                if f.read(len(self.MAGIC)) != self.MAGIC:
+                    return
+                header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]).decode('utf-8'))
+                if header['key'] != self._key():
+                    return
+                points = []
+                for out, pos, bits in header['points']:
+                    window = zlib.decompress(f.read(struct.unpack('<I', f.read(4))[0]))
+                    points.append((out, pos, bits, window))
+        except (IOError, OSError, ValueError, KeyError, struct.error, zlib.error):
+            return
+        self.size, self.points = header['total'], points
+
+    def _save_index(self):
+        import json
+        import struct
+        import zlib
+
+        header = json.dumps({'key': self._key(), 'total': self.size, 'spacing': self.spacing,
+                             'points': [p[:3] for p in self.points]}).encode('utf-8')
+        try:
+            with open(self.name + '.gzidx.tmp', 'wb') as f:
+                f.write(self.MAGIC + struct.pack('<I', len(header)) + header)
+                for p in self.points:
+                    window = zlib.compress(p[3])
+                    f.write(struct.pack('<I', len(window)) + window)
+            os.rename(self.name + '.gzidx.tmp', self.name + '.gzidx')
+        except (IOError, OSError):
+            pass
+
+    def _restart(self, pos):
+        """starts decompression at the nearest checkpoint before pos"""
+        import bisect
+
+        i = bisect.bisect_right(self._outs, pos) - 1
+        if i < 0:
+            self._fh.seek(0)
+            self._z, self._zpos = _Inflater(self._fh), 0
+            return
+        out, start, bits, window = self.points[i]
+        self._fh.seek(start - (1 if bits else 0))
+        value = _byte(self._fh.read(1)) if bits else 0
+        self._z, self._zpos = _Inflater(self._fh, raw=True), out
+        self._z.restart(bits, value, window)
+
+    def _read_at(self, pos, size):
+        import bisect
+        import ctypes
+
+        # live stream is continued if no checkpoint lies between it and the position
+        i = bisect.bisect_right(self._outs, pos) - 1
+        if self._z is None or self._zpos > pos or (i >= 0 and self._outs[i] > self._zpos):
+            self._restart(pos)
+
+        buf = ctypes.create_string_buffer(max(size, min(pos - self._zpos, 1 << 20)))
+        while self._zpos < pos:
+            n = self._z.read(buf, min(len(buf), pos - self._zpos))
+            if not n:
+                return b''
+            self._zpos += n
+        n = self._z.read(buf, size)
+        self._zpos += n
+        return buf.raw[:n]
+
+
+def _varint(data, pos):
+    """decodes xz variable length integer, returns (value, next position)"""
+    value = shift = 0
+    while True:
+        b = _byte(data[pos:])
+        value |= (b & 0x7f) << shift
+        pos += 1
+        shift += 7
+        if not b & 0x80:
+            return value, pos
+
+
+class XzReader(CompressedReader):
+    """
+    random access to xz file through index of its blocks, only blocks overlapping
+    read range are decoded (file compressed in single block is decoded from start)
+    """
+    CHECK_SIZES = (0, 4, 4, 4, 8, 8, 8, 16, 16, 16, 32, 32, 32, 64, 64, 64)
+
+    def __init__(self, path):
+        CompressedReader.__init__(self, path)
+        self.blocks = self._read_index()
+        self._starts = [b[2] for b in self.blocks]
+        self.size = self.blocks[-1][2] + self.blocks[-1][3] if self.blocks else 0
+        self._dec = None
+
+    def _read_index(self):
+        """
+        list of blocks (compressed offset, unpadded size, uncompressed offset,
+        uncompressed size, check size) of all concatenated streams
+        """
+        import struct
+
+        fh = self._fh
+        fh.seek(0, os.SEEK_END)
+        end = fh.tell()
+        streams = []
+        while end > 0:
+            fh.seek(end - 12)
+            footer = fh.read(12)
+            if footer == b'\0' * 12 or footer[-4:] == b'\0' * 4:
+                # stream padding
+                end -= 4
+                continue
+            if footer[10:12] != b'YZ':
+                raise IOError("%s is not xz file" % self.name)
+            check = self.CHECK_SIZES[_byte(footer[9:]) & 0x0f]
+            index_size = (struct.unpack('<I', footer[4:8])[0] + 1) * 4
+            fh.seek(end - 12 - index_size)
+            index = fh.read(index_size)
+            count, pos = _varint(index, 1)
+            records = []
+            for i in range(count):
+                unpadded, pos = _varint(index, pos)
+                size, pos = _varint(index, pos)
+                records.append((unpadded, size))
+            start = end - 12 - index_size - sum((u + 3) // 4 * 4 for u, _ in records) - 12
+            offset = start + 12
+            stream = []
+            for unpadded, size in records:
+                stream.append((offset, unpadded, size, check))
+                offset += (unpadded + 3) // 4 * 4
+            streams.insert(0, stream)
+            end = start
+
+        blocks = []
+        out = 0
+        for stream in streams:
+            for offset, unpadded, size, check in stream:
+                blocks.append((offset, unpadded, out, size, check))
+                out += size
+        return blocks
+
+    def _decoder(self, i):
+        """raw decoder of i-th block, returns (decoder, offset of data, size of data)"""
+        import lzma
+
+        offset, unpadded, out, size, check = self.blocks[i]
+        self._fh.seek(offset)
+        header = self._fh.read(1)
+        header += self._fh.read((_byte(header) + 1) * 4 - 1)
+        flags = _byte(header[1:])
+        pos = 2
+        if flags & 0x40:
+            pos = _varint(header, pos)[1]
+        if flags & 0x80:
+            pos = _varint(header, pos)[1]
+        filters = []
+        for f in range((flags & 3) + 1):
+            fid, pos = _varint(header, pos)
+            psize, pos = _varint(header, pos)
+            filters.append(lzma._decode_filter_properties(fid, header[pos:pos + psize]))
+            pos += psize
+        dec = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=filters)
+        return dec, offset + len(header), unpadded - len(header) - check
+
+    def _read_at(self, pos, size):
+        import bisect
+
+        res = []
+        while size > 0:
+            i = bisect.bisect_right(self._starts, pos) - 1
+            if i < 0:
+                break
+            start = self.blocks[i][2]
+            # live decoder continues forward reads within the block
+            if self._dec is None or self._dec[0] != i or self._dec[1] > pos:
+                dec, data, remaining = self._decoder(i)
+                self._dec = [i, start, dec, data, remaining]
+            while self._dec[1] < pos:
+                if not self._decode(min(pos - self._dec[1], 1 << 20)):
+                    return b''.join(res)
+            chunk = self._decode(min(size, start + self.blocks[i][3] - pos))
+            if not chunk:
+                break
+            res.append(chunk)
+            pos += len(chunk)
+            size -= len(chunk)
+        return b''.join(res)
+
+    def _decode(self, size):
+        """decodes size bytes of the current block, from position of the live decoder"""
+        i, out, dec, data, remaining = self._dec
+        res = []
+        while size > 0 and not dec.eof:
+            chunk = b''
+            if dec.needs_input:
+                if not remaining:
+                    break
+                self._fh.seek(data)
+                chunk = self._fh.read(min(_CHUNK, remaining))
+                data += len(chunk)
+                remaining -= len(chunk)
+            part = dec.decompress(chunk, size)
+            res.append(part)
+            size -= len(part)
+            out += len(part)
+        self._dec = [i, out, dec, data, remaining]
+        return b''.join(res)
+
+
+def _compressed(path):
+    return not hasattr(path, 'read') and os.path.splitext(path)[1] in COMPRESSED_EXTENSIONS
+
+
+def copen(path, spacing=4 << 20, cache=True, seekable=True):
+    """
+    opens file for random access binary reading: plain files with open, gzip and
+    xz files with GzipReader and XzReader. Seeking near the end of compressed
+    file decompresses only the data from the nearest checkpoint (gzip) or block
+    (xz). If system zlib is not available gzip files are opened with gzip module
+    (seeking backwards decompresses from the beginning)
+    parameters:
+      - spacing(int): distance of gzip checkpoints in uncompressed bytes
+      - cache(boolean): cache gzip index next to the file (*.gzidx)
+      - seekable(boolean): if False compressed files are opened with gzip and
+                           lzma modules, without index, for reading forward
+                           only (e.g. parsing the whole file)
+    example:
+     with copen('log.simpleFoam.gz') as f:
+         print tail(f, 10)
+    """
+    ext = os.path.splitext(path)[1]
+    if ext == '.gz':
+        if not seekable or _libz() is None:
+            import gzip
+            return gzip.open(path, 'rb')
+        return GzipReader(path, spacing, cache)
+    if ext == '.xz':
+        if not seekable:
+            import lzma
+            return lzma.open(path, 'rb')
+        return XzReader(path)
+    return open(path, 'rb')
@@ -0,0 +1,249 @@
+"""
+Incremental parser of OpenFOAM solver logs. Parser remembers byte offset and
+unfinished last line of the log, each poll parses only bytes appended since
+the previous one into columnar numpy arrays (one row per time step)
+
+example:
+ parser = LogParser('case/log.pimpleFoam', state='case/log.pimpleFoam.state')
+ while running:
+     if parser.poll():
+         plot(parser.columns['time'], parser.columns['Ux'])
+     time.sleep(60)
+"""
+import os
+import re
+import json
+
+import numpy as np
+
+# float literal as printed by OpenFOAM, including nan and inf of diverged runs
+FLOAT = br'[-+]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|nan|inf)'
+# residual of scalar, or of coupled vector/tensor solution "(0.1 0.2 0)"
+RESIDUAL = br'(?:' + FLOAT + br'|\(\s*' + FLOAT + br'(?:\s+' + FLOAT + br')*\s*\))'
+
+# single pass over appended bytes, alternatives are distinguished by group names
+LINE = re.compile(
+    br'^(?:Time = (?P<time>' + FLOAT + br')s?\s*$'
+    br'|(?P<solver>\w+):\s+Solving for (?P<field>[\w.:]+), Initial residual = (?P<initial>' + RESIDUAL + br'), '
+    br'Final residual = (?P<final>' + RESIDUAL + br'), No Iterations (?P<iterations>\d+)'
+    br'|time step continuity errors : sum local = (?P<local>' + FLOAT + br'), global = (?P<global>' + FLOAT +
+    br'), cumulative = (?P<cumulative>' + FLOAT + br')'
+    br'|ExecutionTime = (?P<execution>' + FLOAT + br') s\s+ClockTime = (?P<clock>' + FLOAT + br') s)',
+    re.MULTILINE)
+
+# names of components of coupled solutions, the same as segregated solvers print (Ux, Uy, Uz)
+COMPONENTS = {3: ('x', 'y', 'z'), 6: ('xx', 'xy', 'xz', 'yy', 'yz', 'zz'),
+              9: ('xx', 'xy', 'xz', 'yx', 'yy', 'yz', 'zx', 'zy', 'zz')}
+
+# number of bytes at the beginning of the log used to recognize the same file
+HEAD_SIZE = 256
+
+
+class Table(object):
+    """
+    Growable columnar storage: float64 columns sharing the number of rows, storage
+    is doubled when full. Columns added later are filled with NaN for earlier rows
+    """
+    def __init__(self, capacity=1024):
+        self.rows = 0
+        self.capacity = capacity
+        self._columns = dict()
+
+    def add_row(self):
+        if self.rows == self.capacity:
+            self.capacity *= 2
+            for name, column in self._columns.items():
+                grown = np.full(self.capacity, np.nan)
+                grown[:self.rows] = column[:self.rows]
+                self._columns[name] = grown
+        self.rows += 1
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.full(self.capacity, np.nan)
+        return self._columns[name]
+
+    def set(self, name, value):
+        """sets value of the column in the last row"""
+        self.column(name)[self.rows - 1] = value
+
+    def add(self, name, value):
+        """adds value to the column in the last row, NaN is taken as 0"""
+        column = self.column(name)
+        last = column[self.rows - 1]
+        column[self.rows - 1] = value if last != last else last + value
+
+    def columns(self):
+        """dictionary of column arrays, views of the storage (valid until next row is added)"""
+        return dict((name, column[:self.rows]) for name, column in self._columns.items())
+
+    def load(self, columns):
+        self.rows = len(columns['time']) if 'time' in columns else 0
+        self.capacity = max(self.capacity, self.rows)
+        self._columns = dict()
+        for name, values in columns.items():
+            self.column(name)[:self.rows] = values
+
+
+class LogParser(object):
+    """
+    Resumable parser of OpenFOAM solver log. Columns (numpy arrays, one row per
+    time step):
+      - time
+      - <field> - initial residual of the first solution of the field in the time step
+      - <field>_final - final residual of the last solution of the field
+      - <field>_iterations - total number of solver iterations of the field
+      coupled solutions of vectors and tensors (residuals printed as "(0.1 0.2 0)")
+      give columns of components named as by segregated solvers (Ux, Uy, Uz)
+      - continuity_local, continuity_global, continuity_cumulative
+      - execution_time, clock_time
+    Truncated or rotated log (file smaller than parsed offset, different inode or
+    different beginning of the file) is parsed again from the beginning
+    parameters:
+      - path(string): log file
+      - state(string): file where parser state and columns are persisted (numpy
+                       *.npz), parser resumes from it if it exists and saves it
+                       after each poll which read new data
+    """
+    def __init__(self, path, state=None):
+        self.path = path
+        self.state = state
+        self.resets = 0
+        self.skipped = 0
+        self._reset()
+        if state and os.path.exists(state):
+            self.load()
+
+    def _reset(self):
+        self.offset = 0
+        self.partial = b''
+        self.inode = None
+        self.head = b''
+        self.table = Table()
+        # fields already solved in the last time step, it may continue in the next poll
+        self._solved = set()
+
+    @property
+    def columns(self):
+        return self.table.columns()
+
+    def _changed(self, fh, stat):
+        """checks if parsed data comes from the current file"""
+        if self.offset == 0:
+            return False
+        if stat.st_size < self.offset or (self.inode is not None and stat.st_ino != self.inode):
+            return True
+        fh.seek(0)
+        return fh.read(len(self.head)) != self.head
+
+    def poll(self):
+        """
+        parses bytes appended to the log since the last poll
+        returns number of time steps started by the new data
+        """
+        if not os.path.exists(self.path):
+            return 0
+
+        with open(self.path, 'rb') as fh:
+            stat = os.fstat(fh.fileno())
+            if self._changed(fh, stat):
+                self._reset()
+                self.resets += 1
+            if stat.st_size == self.offset:
+                return 0
+            if len(self.head) < HEAD_SIZE:
+                fh.seek(0)
+                self.head = fh.read(min(HEAD_SIZE, stat.st_size))
+            self.inode = stat.st_ino
+            fh.seek(self.offset)
+            data = fh.read(stat.st_size - self.offset)
+
+        offset = self.offset + len(data)
+        data = self.partial + data
+        # unfinished last line is kept for the next poll
+        cut = data.rfind(b'\n') + 1
+
+        rows = self.table.rows
+        self.parse(data[:cut])
+        self.offset = offset
+        self.partial = data[cut:]
+        if self.state:
+            self.save()
+        return self.table.rows - rows
+
+    def parse(self, data):
+        """
+        parses block of complete lines into columns, lines with values which
+        can't be converted are skipped (counted in skipped)
+        """
+        table = self.table
+        solved = self._solved
+        for match in LINE.finditer(data):
+            group = match.lastgroup
+            try:
+                if group == 'time':
+                    time = float(match.group('time'))
+                    table.add_row()
+                    table.set('time', time)
+                    solved = set()
+                elif not table.rows:
+                    # initialization before the first time step
+                    continue
+                elif group == 'iterations':
+                    self._solution(match, solved)
+                elif group == 'cumulative':
+                    values = [float(match.group(g)) for g in ('local', 'global', 'cumulative')]
+                    for name, value in zip(('continuity_local', 'continuity_global', 'continuity_cumulative'), values):
+                        table.set(name, value)
+                elif group == 'clock':
+                    execution, clock = float(match.group('execution')), float(match.group('clock'))
+                    table.set('execution_time', execution)
+                    table.set('clock_time', clock)
+            except ValueError:
+                self.skipped += 1
+        self._solved = solved
+
+    def _solution(self, match, solved):
+        """stores residuals and iterations of "Solving for" line"""
+        table = self.table
+        field = match.group('field').decode('ascii')
+        initial = [float(v) for v in match.group('initial').strip(b'()').split()]
+        final = [float(v) for v in match.group('final').strip(b'()').split()]
+        if len(initial) != len(final):
+            raise ValueError("different number of initial and final residuals")
+        iterations = int(match.group('iterations'))
+        names = [field]
+        if match.group('initial').startswith(b'('):
+            # coupled solution, one column per component
+            names = [field + c for c in COMPONENTS.get(len(initial), [str(i) for i in range(len(initial))])]
+        for name, first, last in zip(names, initial, final):
+            if name not in solved:
+                table.set(name, first)
+                solved.add(name)
+            table.set(name + '_final', last)
+            table.add(name + '_iterations', iterations)
+
+    def save(self):
+        """saves parser state and columns into state file"""
+        state = {'path': os.path.abspath(self.path), 'offset': self.offset, 'inode': self.inode,
+                 'partial': self.partial.decode('latin-1'), 'head': self.head.decode('latin-1'),
+                 'solved': sorted(self._solved)}
+        tmp = self.state + '.tmp.npz'
+        np.savez(tmp, __state__=np.array(json.dumps(state)), **self.columns)
+        os.rename(tmp, self.state)
+
+    def load(self):
+        """restores parser state and columns from state file"""
+        try:
+            with np.load(self.state) as f:
+                state = json.loads(str(f['__state__']))
+                columns = dict((name, f[name]) for name in f.files if name != '__state__')
+        except (IOError, OSError, ValueError, KeyError):
+            print("Can't read parser state {}, log will be parsed from the beginning".format(self.state))
+            return
+        self.offset = state['offset']
+        self.inode = state['inode']
+        self.partial = state['partial'].encode('latin-1')
+        self.head = state['head'].encode('latin-1')
+        self._solved = set(state['solved'])
+        self.table.load(columns)
@@ -0,0 +1,192 @@
+"""
+Instrumentation of scripts: wall time and peak memory of named stages, optional cProfile dump
+
+example:
+ timer = StageTimer()
+ with timer.stage('parse'):
+     data = load(path)
+ with timer.stage('render'):
+     draw(data)
+ timer.report()
+"""
+import sys
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
+
+
+def format_bytes(size):
+    """human readable size, e.g. 12.3 MB"""
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(size) < 1024. or unit == 'GB':
+            return "%.1f %s" % (size, unit)
+        size /= 1024.
+
+
+def max_rss():
+    """peak resident memory of the process in bytes, None if not available on the platform"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, mac os bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class _Frame(object):
+    def __init__(self, name, memory):
+        self.name = name
+        self.clock = clock()
+        self.memory = memory
+        self.peak = memory
+
+
+class StageTimer(object):
+    """
+    Collects wall time and peak memory of named stages. Stages may be nested and entered many times, times of repeated
+    stages with the same parent stages are summed up. Memory is measured with tracemalloc (python 3 only, numpy arrays
+    included): peak is the largest amount of memory allocated above the level at the stage entry
+    parameters:
+      - memory(boolean): trace memory allocations, slows down allocation heavy python code
+    """
+    def __init__(self, memory=True):
+        self.memory = memory and tracemalloc is not None
+        self.stages = []
+        self._stats = dict()
+        self._stack = []
+        self._started = False
+
+    def _traced(self):
+        if not self.memory:
+            return 0, 0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        return tracemalloc.get_traced_memory()
+
+    def _reset_peak(self):
+        # reset_peak is available since python 3.9, older versions report peaks since start of tracing
+        if self.memory and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name):
+        current, peak = self._traced()
+        for frame in self._stack:
+            frame.peak = max(frame.peak, peak)
+        self._reset_peak()
+
+        frame = _Frame(name, current)
+        key = tuple(f.name for f in self._stack) + (name,)
+        if key not in self._stats:
+            self.stages.append(key)
+            self._stats[key] = {'calls': 0, 'time': 0., 'peak': 0}
+        self._stack.append(frame)
+        try:
+            yield frame
+        finally:
+            elapsed = clock() - frame.clock
+            current, peak = self._traced()
+            frame.peak = max(frame.peak, peak)
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, frame.peak)
+            self._reset_peak()
+
+            stats = self._stats[key]
+            stats['calls'] += 1
+            stats['time'] += elapsed
+            stats['peak'] = max(stats['peak'], frame.peak - frame.memory)
+
+    def timed(self, name=None):
+        """decorator measuring each call of the function as stage, by default named after the function"""
+        def provider(fun):
+            def wrap(*args, **kwargs):
+                with self.stage(name or fun.__name__):
+                    return fun(*args, **kwargs)
+            wrap.__name__ = fun.__name__
+            wrap.__doc__ = fun.__doc__
+            return wrap
+        return provider
+
+    def results(self):
+        """
+        list of dictionaries with name, path (names of parent stages and the stage), depth (number of parent stages),
+        calls, time (seconds) and peak (bytes) of stages. Stages are ordered depth first, each stage is followed by
+        its nested stages, siblings in order of first entry
+        """
+        first = dict((key, i) for i, key in enumerate(self.stages))
+        ordered = sorted(self.stages, key=lambda k: [first[k[:i + 1]] for i in range(len(k))])
+        res = []
+        for key in ordered:
+            stats = dict(self._stats[key])
+            stats['name'] = key[-1]
+            stats['path'] = key
+            stats['depth'] = len(key) - 1
+            if not self.memory:
+                stats['peak'] = None
+            res.append(stats)
+        return res
+
+    def report(self, out=None):
+        """prints table of stages, nested stages are indented"""
+        out = out or sys.stderr
+        width = max([len(k[-1]) + 2 * len(k) - 2 for k in self.stages] + [5])
+        out.write("%-*s %6s %10s %12s\n" % (width, 'stage', 'calls', 'time [s]', 'peak mem'))
+        for stats in self.results():
+            name = '  ' * stats['depth'] + stats['name']
+            peak = format_bytes(stats['peak']) if stats['peak'] is not None else '-'
+            out.write("%-*s %6d %10.3f %12s\n" % (width, name, stats['calls'], stats['time'], peak))
+        rss = max_rss()
+        if rss is not None:
+            out.write("peak resident memory of the process: %s\n" % format_bytes(rss))
+
+    def stop(self):
+        """stops memory tracing if it was started by this timer"""
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+
+class NullTimer(object):
+    """StageTimer replacement which measures nothing, lets instrumented code run without overhead"""
+    @contextmanager
+    def stage(self, name):
+        yield None
+
+    def timed(self, name=None):
+        return lambda fun: fun
+
+
+@contextmanager
+def profiled(path=None, sort='cumulative', limit=30, out=None):
+    """
+    Runs enclosed code under cProfile
+    parameters:
+      - path(string): file to dump stats to (readable with pstats or snakeviz), if None stats are printed
+      - sort(string): pstats sort key of printed stats
+      - limit(int): number of printed functions
+    """
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        if path:
+            profile.dump_stats(path)
+        else:
+            pstats.Stats(profile, stream=out or sys.stderr).sort_stats(sort).print_stats(limit)